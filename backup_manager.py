@@ -1,6 +1,100 @@
+"""
+Sauvegarde des réseaux neuronaux
+
+Deux formats sont disponibles :
+
+- le format JSON historique (:meth:`BackupManager.create` et :meth:`BackupManager.load`), lisible
+  mais volumineux, qui enregistre chaque neurone séparément ;
+- un format binaire compact (:meth:`BackupManager.save_checkpoint` et
+  :meth:`BackupManager.load_checkpoint`), adapté aux grandes populations : un en-tête donnant la
+  taille des couches, suivi des génomes puis des valeurs de tous les réseaux, sous forme de blocs
+  de nombres bruts lisibles directement avec `numpy.frombuffer` ou `numpy.memmap`.
+"""
+
 from classes import *
-from typing import List
+from typing import List, Optional
 import json
+import os
+import struct
+import threading
+import numpy as np
+
+#: Signature au début de chaque sauvegarde binaire
+CHECKPOINT_MAGIC = b"TIPENN"
+#: Version du format binaire
+CHECKPOINT_VERSION = 1
+#: Extension des sauvegardes binaires
+CHECKPOINT_EXTENSION = ".bin"
+# Signature, version, type des nombres ('f' ou 'd'), nombre de couches, nombre de réseaux et
+# longueur des métadonnées
+_HEADER = struct.Struct("<6sBcIII")
+# Les blocs de nombres commencent à une position multiple de cette taille
+_ALIGNMENT = 16
+
+
+class Checkpoint:
+    """Contenu d'une sauvegarde binaire
+
+    Les génomes et les valeurs sont lus sans copie : ils peuvent être en lecture seule, ou
+    projetés en mémoire depuis le fichier (voir :meth:`BackupManager.load_checkpoint`).
+    """
+
+    def __init__(self, sizes: List[int], genomes: np.ndarray, values: np.ndarray,
+                 metadata: dict):
+        self.sizes: List[int] = sizes  #: Nombre de neurones de chaque couche
+        #: Génome de chaque réseau, de taille (N, P) (voir :attr:`classes.Network.genome`)
+        self.genomes: np.ndarray = genomes
+        #: Valeurs des neurones de chaque réseau, toutes couches à la suite, de taille (N, V)
+        self.values: np.ndarray = values
+        self.metadata: dict = metadata  #: Informations supplémentaires enregistrées
+
+    def __len__(self) -> int:
+        return len(self.genomes)
+
+    def apply(self, net: Network, index: int = 0):
+        """Copie le génome et les valeurs d'un réseau enregistré dans un réseau existant
+
+        Parameters
+        ----------
+        net:
+            Réseau à modifier, dont les couches doivent avoir les mêmes tailles
+        index:
+            Indice du réseau enregistré [par défaut le premier]
+        """
+        assert list(net.sizes) == list(self.sizes), "Tailles de couches incompatibles"
+        bounds = np.cumsum(self.sizes)[:-1]
+        net.values = [layer.astype(float) for layer in np.split(self.values[index], bounds)]
+        net.genome = np.array(self.genomes[index], dtype=float)
+
+    def restore(self, networks: List[Network]) -> int:
+        """Copie tous les réseaux enregistrés dans une population existante, dans l'ordre
+
+        Les génomes et les valeurs sont convertis en une seule fois : chaque réseau reçoit une
+        vue sur une ligne des nouveaux tableaux, sans copie supplémentaire.
+
+        Parameters
+        ----------
+        networks:
+            Réseaux à modifier, dont les couches doivent avoir les mêmes tailles. S'ils sont plus
+            nombreux que les réseaux enregistrés, les derniers ne sont pas modifiés
+
+        Returns
+        -------
+        :class:`int`:
+            Nombre de réseaux modifiés
+        """
+        count = min(len(networks), len(self))
+        if count == 0:
+            return 0
+        assert all(list(net.sizes) == list(self.sizes) for net in networks[:count]
+                   ), "Tailles de couches incompatibles"
+        genomes = np.array(self.genomes[:count], dtype=float)
+        values = np.split(np.array(self.values[:count], dtype=float),
+                          np.cumsum(self.sizes)[:-1], axis=1)
+        for index, net in enumerate(networks[:count]):
+            net.values = [layer[index] for layer in values]
+            net.genome = genomes[index]
+        return count
 
 
 class BackupManager():
@@ -8,12 +102,16 @@ class BackupManager():
         self.filename = filename
         if not self.filename.endswith(".json"):
             self.filename += ".json"
+        #: Nom de la sauvegarde binaire, à côté de la sauvegarde JSON
+        self.checkpoint_filename: str = self.filename[:-len(".json")] + CHECKPOINT_EXTENSION
+        # Thread de l'écriture en arrière-plan en cours (voir :meth:`save_checkpoint`)
+        self._writer: Optional[threading.Thread] = None
 
     def _neuron(self, neur: Neuron) -> dict:
         return {
-            "value": neur.value,
-            "weight": neur.weight,
-            "bias": neur.bias
+            "value": float(neur.value),
+            "weight": neur.weight.tolist(),
+            "bias": float(neur.bias)
         }
 
     def _network(self, net: Network) -> dict:
@@ -69,3 +167,103 @@ class BackupManager():
                 "networks": None,
                 "circuit": None
             }
+
+    def save_checkpoint(self, networks: List[Network], dtype: type = np.float64,
+                        metadata: Optional[dict] = None, background: bool = False):
+        """Enregistre des réseaux dans le format binaire
+
+        Le fichier est d'abord écrit sous un nom temporaire puis renommé, pour qu'une sauvegarde
+        interrompue ne remplace jamais la précédente.
+
+        En arrière-plan, les réseaux sont copiés immédiatement mais écrits sur le disque par un
+        autre thread : ils peuvent être modifiés dès le retour de la fonction. Une seule écriture
+        a lieu à la fois, la suivante attendant la fin de la précédente (voir :meth:`wait`).
+
+        Parameters
+        ----------
+        networks:
+            Réseaux à enregistrer, dont les couches ont toutes les mêmes tailles
+        dtype:
+            Type des nombres enregistrés, `numpy.float32` ou `numpy.float64` [par défaut
+            `numpy.float64`, sans perte]
+        metadata:
+            Informations supplémentaires à enregistrer, sérialisables en JSON
+        background:
+            Si l'écriture doit avoir lieu dans un thread séparé [par défaut non]
+        """
+        dtype = np.dtype(dtype)
+        assert dtype in (np.float32, np.float64), "Invalid type for dtype"
+        sizes = networks[0].sizes
+        genomes = np.stack([net.genome for net in networks]).astype(dtype)
+        values = np.stack([np.concatenate(net.values) for net in networks]).astype(dtype)
+        meta = json.dumps(metadata or {}).encode("utf-8")
+        header = _HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, dtype.char.encode(),
+                              len(sizes), len(networks), len(meta)) \
+            + np.array(sizes, dtype="<u4").tobytes() + meta
+        header += bytes(-len(header) % _ALIGNMENT)
+        blocks = (header, genomes.astype(dtype.newbyteorder("<")),
+                  values.astype(dtype.newbyteorder("<")))
+        self.wait()
+        if background:
+            # Thread non daemon : le programme attend la fin de l'écriture avant de se fermer
+            self._writer = threading.Thread(target=self._write_checkpoint, args=blocks)
+            self._writer.start()
+        else:
+            self._write_checkpoint(*blocks)
+
+    def _write_checkpoint(self, *blocks):
+        """Écrit les blocs d'une sauvegarde binaire sous un nom temporaire, puis renomme le
+        fichier"""
+        temporary = self.checkpoint_filename + ".tmp"
+        with open(temporary, "wb") as myfile:
+            for block in blocks:
+                myfile.write(block)
+        os.replace(temporary, self.checkpoint_filename)
+
+    def wait(self):
+        """Attend la fin de l'écriture en arrière-plan en cours, s'il y en a une"""
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+    def load_checkpoint(self, mmap: bool = False) -> Optional[Checkpoint]:
+        """Charge les réseaux enregistrés dans le format binaire
+
+        Parameters
+        ----------
+        mmap:
+            Si les génomes et les valeurs doivent être projetés en mémoire depuis le fichier au
+            lieu d'être lus : seuls les réseaux réellement utilisés sont alors lus sur le disque
+
+        Returns
+        -------
+        Optional[:class:`Checkpoint`]:
+            Le contenu de la sauvegarde, ou None si elle n'existe pas
+        """
+        try:
+            with open(self.checkpoint_filename, "rb") as myfile:
+                data = myfile.read() if not mmap else myfile.read(_HEADER.size)
+                magic, version, char, layers, count, meta_length = _HEADER.unpack_from(data)
+                if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+                    raise ValueError("Invalid checkpoint file: " + self.checkpoint_filename)
+                if mmap:
+                    data += myfile.read(4 * layers + meta_length)
+        except FileNotFoundError:
+            return None
+        dtype = np.dtype(char.decode()).newbyteorder("<")
+        sizes = np.frombuffer(data, "<u4", layers, _HEADER.size).tolist()
+        meta_start = _HEADER.size + 4 * layers
+        metadata = json.loads(data[meta_start:meta_start + meta_length].decode("utf-8"))
+        offset = meta_start + meta_length
+        offset += -offset % _ALIGNMENT
+        genome_size = sum(n1*n2 for n1, n2 in zip(sizes, sizes[1:])) + sum(sizes)
+        shapes = [(count, genome_size), (count, sum(sizes))]
+        blocks = []
+        for shape in shapes:
+            if mmap:
+                blocks.append(np.memmap(self.checkpoint_filename, dtype, "r", offset, shape))
+            else:
+                blocks.append(np.frombuffer(data, dtype, shape[0] * shape[1],
+                                            offset).reshape(shape))
+            offset += shape[0] * shape[1] * dtype.itemsize
+        return Checkpoint(sizes, blocks[0], blocks[1], metadata)
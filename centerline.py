@@ -0,0 +1,109 @@
+"""
+Ligne centrale du circuit
+
+Le tracé de base généré par :func:`circuit.circuit_creation` passe au milieu de la piste, du départ
+à l'arrivée. :class:`Centerline` le conserve avec la distance cumulée le long du tracé à chacun de
+ses points, ce qui permet de mesurer la progression réelle d'une voiture sur la piste : la distance
+entre le départ et le point du tracé le plus proche d'elle. Contrairement à la distance parcourue,
+elle n'augmente pas quand une voiture tourne en rond.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from spatial_index import BorderGrid, point_segment_projections, prefix_arrays, unprefix_arrays
+
+#: Rayon de recherche par défaut des segments du tracé autour d'une voiture, en pixels
+DEFAULT_SEARCH_RADIUS = 60
+
+
+class Centerline:
+    """Tracé central du circuit, mesuré par sa longueur cumulée
+
+    Les segments du tracé sont rangés dans un index spatial (:class:`spatial_index.BorderGrid`),
+    pour que chaque voiture ne soit projetée que sur les segments proches d'elle.
+    """
+
+    def __init__(self, pathway: List[Tuple[float, float]], screen_size: Tuple[int, int],
+                 search_radius: float = DEFAULT_SEARCH_RADIUS,
+                 index: Optional[BorderGrid] = None):
+        """Initialise le tracé
+
+        Parameters
+        ----------
+        pathway:
+            Points du tracé, du départ à l'arrivée
+        screen_size: (:class:`int`, :class:`int`)
+            Taille de la fenêtre, en (x, y)
+        search_radius:
+            Distance maximale entre une voiture et les segments sur lesquels elle est projetée,
+            avant de tester tout le tracé [par défaut :data:`DEFAULT_SEARCH_RADIUS`]
+        index:
+            Index spatial déjà construit pour les segments du tracé [par défaut un nouvel index]
+        """
+        #: Points du tracé, de taille (P, 2)
+        self.points: np.ndarray = np.asarray(pathway, dtype=float).reshape(-1, 2)
+        #: Segments du tracé, de taille (P-1, 4)
+        self.segments: np.ndarray = np.hstack([self.points[:-1], self.points[1:]])
+        #: Longueur de chaque segment
+        self.lengths: np.ndarray = np.hypot(*(self.points[1:] - self.points[:-1]).T)
+        #: Distance le long du tracé entre le départ et chaque point, de taille (P,)
+        self.cumulative: np.ndarray = np.concatenate([[0], np.cumsum(self.lengths)])
+        self.length: float = float(self.cumulative[-1])  #: Longueur totale du tracé
+        self.search_radius: float = search_radius  #: Rayon de recherche des segments
+        #: Index spatial des segments du tracé
+        self.index: BorderGrid = index if index is not None \
+            else BorderGrid(self.segments, screen_size)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Exporte le tracé et son index sous forme de tableaux, pour l'enregistrer sur le disque
+        (voir :mod:`circuit_cache`)"""
+        arrays = prefix_arrays("index_", self.index.to_arrays())
+        arrays["points"] = self.points
+        arrays["search_radius"] = np.array(self.search_radius, dtype=float)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray],
+                    screen_size: Tuple[int, int]) -> "Centerline":
+        """Reconstruit un tracé exporté par :meth:`to_arrays`, sans reconstruire son index"""
+        index = BorderGrid.from_arrays(unprefix_arrays("index_", arrays))
+        return cls(arrays["points"], screen_size, float(arrays["search_radius"]), index)
+
+    def project(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Projette des positions sur le segment le plus proche du tracé
+
+        Parameters
+        ----------
+        positions:
+            Positions à projeter, de taille (C, 2)
+
+        Returns
+        -------
+        (:class:`numpy.ndarray`, :class:`numpy.ndarray`):
+            La progression de chaque position, c'est-à-dire la distance le long du tracé entre
+            le départ et son projeté, et la distance entre chaque position et le tracé
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        if len(self.segments) == 0:
+            return np.zeros(len(positions)), np.full(len(positions), np.inf)
+        progress, distances = self._nearest(
+            positions, self.index.candidates(positions, self.search_radius))
+        # Positions trop loin du tracé pour que l'index suffise : on teste tous ses segments
+        lost = distances > self.search_radius
+        if lost.any():
+            everything = np.broadcast_to(np.arange(len(self.segments)),
+                                         (int(lost.sum()), len(self.segments)))
+            progress[lost], distances[lost] = self._nearest(positions[lost], everything)
+        return progress, distances
+
+    def _nearest(self, positions: np.ndarray,
+                 indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Projette chaque position sur le plus proche des segments donnés (indices complétés par
+        des -1, voir :meth:`spatial_index.BorderGrid.candidates`)"""
+        t, distances = point_segment_projections(positions, self.segments[indices])
+        distances = np.where(indices >= 0, distances, np.inf)
+        nearest = distances.argmin(axis=1)
+        rows = np.arange(len(positions))
+        segment = indices[rows, nearest]
+        progress = self.cumulative[segment] + t[rows, nearest] * self.lengths[segment]
+        return progress, distances[rows, nearest]
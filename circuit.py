@@ -8,16 +8,21 @@ jusqu'à obtenir le tracé général du circuit. Une épaisseur pseudo-aléatoir
 La seule classe publique est ici :func:`circuit_creation`.
 
 Les constantes affichées ici sont exprimées en pixels selon la taille par défaut de la fenêtre,
-mais sont adaptées à la taille réelle.
+mais sont adaptées à la taille réelle par :func:`fix_points`. Elles ne sont jamais modifiées :
+plusieurs circuits peuvent donc être générés dans un même processus, ou dans plusieurs processus
+en parallèle (voir :meth:`circuit_cache.CircuitCache.generate`).
 """
 
 import typing
-import random
-from math import hypot, sqrt, degrees, atan2
+from math import hypot, degrees, atan2
 import pygame
+import numpy as np
 from pygame.math import Vector2 as Vector
-from classes import Border
+from classes import Border, segments_array
 from config_manager import Config
+from spatial_index import BorderGrid
+from distance_field import DistanceField
+from centerline import Centerline
 
 #: Point approximatif de départ du circuit
 START_POINT = (50, 120)
@@ -40,11 +45,35 @@ RANDOM_GENPOINT_AMPLITUDE = 0.2
 MIN_PATH_WIDTH = 70
 #: Largeur maximale du circuit
 MAX_PATH_WIDTH = 105
+#: Nombre de points candidats tirés en une fois par :func:`generate_point`
+CANDIDATES_BATCH = 64
+#: Nombre maximal de points candidats tirés pour plier un segment
+MAX_CANDIDATES = 700
 #: Nombre de générations successives à appliquer sur la courbe. Plus ce nombre est grand, plus la
 #: courbe sera détaillée
 GENERATIONS_NUMBER = 9
 
 
+def random_generators(seed: typing.Optional[int]) -> (np.random.Generator, np.random.Generator):
+    """Crée les deux générateurs aléatoires du programme à partir d'une même graine
+
+    Les deux générateurs sont dérivés de la graine par :meth:`numpy.random.SeedSequence.spawn` :
+    leurs tirages sont indépendants, même s'ils partagent la même graine.
+
+    Parameters
+    ----------
+    seed:
+        Graine aléatoire, ou None pour une graine différente à chaque appel
+
+    Returns
+    -------
+    (:class:`numpy.random.Generator`, :class:`numpy.random.Generator`):
+        Le générateur utilisé pour créer le circuit, et celui utilisé par l'évolution des réseaux
+    """
+    circuit_seed, evolution_seed = np.random.SeedSequence(seed).spawn(2)
+    return np.random.default_rng(circuit_seed), np.random.default_rng(evolution_seed)
+
+
 def calc_angle(point_a: tuple, point_b: tuple, point_c: tuple) -> float:
     """Calcule un angle ABC à partir de coordonnées
 
@@ -85,10 +114,39 @@ def calc_distance(point_a: tuple, point_b: tuple) -> int:
     return round(hypot(point_a[0]-point_b[0], point_a[1]-point_b[1]))
 
 
+def calc_angles(points_a: np.ndarray, points_b: np.ndarray, points_c: np.ndarray) -> np.ndarray:
+    """Version vectorisée de :func:`calc_angle`
+
+    Parameters
+    ----------
+    points_a, points_b, points_c:
+        Points des angles ABC, de taille (..., 2) : un même point peut être utilisé pour tous les
+        angles
+
+    Returns
+    -------
+    :class:`numpy.ndarray`:
+        Mesure de chaque angle, en degrés
+    """
+    points_a, points_b, points_c = (np.asarray(p, dtype=float)
+                                    for p in (points_a, points_b, points_c))
+    angle = np.degrees(np.arctan2(points_c[..., 1]-points_b[..., 1],
+                                  points_c[..., 0]-points_b[..., 0])
+                       - np.arctan2(points_a[..., 1]-points_b[..., 1],
+                                    points_a[..., 0]-points_b[..., 0]))
+    return np.where(angle > 180, angle-360, np.where(angle < -180, 360+angle, angle))
+
+
 def generate_point(point_a: tuple, point_b: tuple, screen_size: tuple, last_move: tuple,
-                   i: int = 0) -> ((int, int), (int, int)):
+                   rng: typing.Optional[np.random.Generator] = None,
+                   max_path_width: float = MAX_PATH_WIDTH) -> ((int, int), (int, int)):
     """Génère un point entre deux autres
 
+    Les points candidats sont tirés par lots de :data:`CANDIDATES_BATCH` autour du milieu du
+    segment, puis filtrés en une seule fois selon leur position dans la fenêtre, leur coût et
+    l'angle formé : le premier candidat valide est gardé. Au bout de :data:`MAX_CANDIDATES`
+    candidats sans succès, le dernier tiré est utilisé malgré tout.
+
     Parameters
     ----------
     point_a: (:class:`int`, :class:`int`)
@@ -100,58 +158,62 @@ def generate_point(point_a: tuple, point_b: tuple, screen_size: tuple, last_move
     last_move: (:class:`int`, :class:`int`)
         Dernier mouvement, en (dx, dy) : chaque coordonnée prend 1 si le delta était positif,
         -1 sinon. Permet de garder une consistance dans les virages
-    i:
-        Nombre de tentatives échouées pour ce point
+    rng:
+        Générateur aléatoire à utiliser [par défaut un nouveau générateur]
+    max_path_width:
+        Largeur maximale du circuit, à l'échelle de la fenêtre (voir :func:`fix_points`) [par
+        défaut :data:`MAX_PATH_WIDTH`]
 
     Returns
     -------
     ((:class:`int`, :class:`int`), (:class:`int`, :class:`int`)):
         Coordonnées du nouveau point, et mouvement effectué (équivalent du last_move)
     """
-    i += 1
-    cost = 1
-    max_cost = 0
-    angle = 0
-    middle = [0, 0]
-    middle[0] = (point_a[0]+point_b[0])//2
-    middle[1] = (point_a[1]+point_b[1])//2
-    min_angle = MIN_ANGLE_DEGREES
-    # ---
+    if rng is None:
+        rng = np.random.default_rng()
+    middle = np.array([[(point_a[0]+point_b[0])//2], [(point_a[1]+point_b[1])//2]])
     radius_max = max(abs(point_a[0] - point_b[0]),
                      abs(point_a[1] - point_b[1]))
-    last_move[0] = last_move[0] if random.random() < 0.7 else (
-        1 if random.random() < 0.5 else -1)
-    new_x = middle[0] + round(radius_max * random.uniform(0.001,
-                                                          RANDOM_GENPOINT_AMPLITUDE) * last_move[0])
-    last_move[1] = last_move[1] if random.random() < 0.7 else (
-        1 if random.random() < 0.5 else -1)
-    new_y = middle[1] + round(radius_max * random.uniform(0.001,
-                                                          RANDOM_GENPOINT_AMPLITUDE) * last_move[1])
-    # ---
-    if i >= 700:
-        return (new_x, new_y), last_move
-    check_borders = MAX_PATH_WIDTH < new_x < screen_size[0]-MAX_PATH_WIDTH \
-        and MAX_PATH_WIDTH < new_y < screen_size[1]-MAX_PATH_WIDTH
-    if check_borders:
-        distance_a_b = calc_distance(point_a, point_b)
-        cost = round(distance_a_b
-                     + calc_distance(point_b, (new_x, new_y))
-                     - calc_distance(point_a, (new_x, new_y)))
-        max_cost = round(distance_a_b * MAX_COST_COEF)
-        if cost < max_cost:
-            angle = abs(calc_angle(point_a, (new_x, new_y), point_b))
-            min_angle += 250/sqrt(distance_a_b)
-    if cost > max_cost or not check_borders or angle < MIN_ANGLE_DEGREES or \
-            angle > MAX_ANGLE_DEGREES:
-        (new_x, new_y), last_move = generate_point(
-            point_a, point_b, screen_size, last_move, i)
-    return (round(new_x), round(new_y)), last_move
+    distance_a_b = calc_distance(point_a, point_b)
+    max_cost = round(distance_a_b * MAX_COST_COEF)
+    # Un candidat est dans la fenêtre si chaque coordonnée est assez proche de son centre
+    center = np.array([[screen_size[0] / 2], [screen_size[1] / 2]])
+    half_size = center - max_path_width
+    vector_a = np.array([[point_a[0]], [point_a[1]]])
+    vector_b = np.array([[point_b[0]], [point_b[1]]])
+    last_move = np.array([[last_move[0]], [last_move[1]]])
+    min_angle, max_angle = np.radians(MIN_ANGLE_DEGREES), np.radians(MAX_ANGLE_DEGREES)
+    drawn = 0
+    while drawn < MAX_CANDIDATES:
+        size = min(CANDIDATES_BATCH, MAX_CANDIDATES - drawn)
+        drawn += size
+        draws = rng.random((4, size))
+        # Chaque direction garde le sens du dernier mouvement avec 70% de chance, et sinon en
+        # change une fois sur deux
+        moves = np.where(draws[:2] < 0.85, last_move, -last_move)
+        amplitudes = radius_max * (0.001 + (RANDOM_GENPOINT_AMPLITUDE - 0.001) * draws[2:])
+        candidates = middle + np.rint(amplitudes) * moves  # (2, size)
+        # Vecteurs allant de chaque candidat vers A et vers B
+        to_a, to_b = vector_a - candidates, vector_b - candidates
+        cost = distance_a_b + np.rint(np.hypot(*to_b)) - np.rint(np.hypot(*to_a))
+        angle = np.arctan2(np.abs(to_a[0] * to_b[1] - to_a[1] * to_b[0]), (to_a * to_b).sum(0))
+        valid = (np.abs(candidates - center) < half_size).all(0) & (cost < max_cost) \
+            & (min_angle <= angle) & (angle <= max_angle)
+        index = int(valid.argmax())
+        if valid[index]:
+            break
+    else:
+        index = -1
+    return (int(candidates[0, index]), int(candidates[1, index])), \
+        [int(moves[0, index]), int(moves[1, index])]
 
 
 def check_angles(pathway: typing.List[tuple]) -> bool:
     """Vérifie si le chemin ne contient pas d'angle bizarre
 
-    Chaque angle bizarre sera supprimé, pour "nettoyer" la courbe.
+    Chaque angle bizarre sera supprimé, pour "nettoyer" la courbe. Tous les angles sont vérifiés
+    en une fois, puis on recommence sur le chemin nettoyé jusqu'à ce qu'il n'y ait plus rien à
+    supprimer.
 
     Un angle est considéré "bizarre" s'il est trop plat ou trop aigu, en référence aux deux
     constantes 'MIN_ANGLE_DEGREES' et 'MAX_ANGLE_DEGREES'.
@@ -166,28 +228,25 @@ def check_angles(pathway: typing.List[tuple]) -> bool:
     :class:`bool`:
         True si au moins un point a été supprimé
     """
-    if len(pathway) < 3:
-        return True
-    result = True
-    wrong_indexes = list()
-    for index in range(1, len(pathway)-1):
-        angle = abs(
-            round(calc_angle(pathway[index-1], pathway[index], pathway[index+1])))
-        if angle > 180:
-            angle = 360-angle
-        result = MIN_ANGLE_DEGREES < angle < MAX_ANGLE_DEGREES
-        if not result:
-            wrong_indexes.insert(0, index)
-    for i in wrong_indexes:
-        pathway.pop(i)
-    if len(wrong_indexes) > 0:
-        check_angles(pathway)
-        return True
-    return False
+    removed = False
+    while len(pathway) >= 3:
+        points = np.asarray(pathway, dtype=float)
+        angles = np.abs(np.round(calc_angles(points[:-2], points[1:-1], points[2:])))
+        wrong_indexes = np.flatnonzero(
+            ~((MIN_ANGLE_DEGREES < angles) & (angles < MAX_ANGLE_DEGREES))) + 1
+        if len(wrong_indexes) == 0:
+            break
+        for i in wrong_indexes[::-1]:
+            pathway.pop(i)
+        removed = True
+    return removed
 
 
 def add_width(pathway: typing.List[tuple], colors: typing.Dict[str, pygame.Color],
-              screen_size: typing.Tuple[int]) -> dict:
+              screen_size: typing.Tuple[int],
+              rng: typing.Optional[np.random.Generator] = None,
+              path_width: typing.Tuple[float, float] = (MIN_PATH_WIDTH, MAX_PATH_WIDTH)
+              ) -> dict:
     """Elargit le circuit à partir du tracé de base
 
     Pour chaque segment du tracé, on calcule la médiatrice du segment puis on trouve deux points
@@ -202,6 +261,11 @@ def add_width(pathway: typing.List[tuple], colors: typing.Dict[str, pygame.Color
         Dictionnaire des couleurs à utiliser
     screen_size: (:class:`int`, :class:`int`)
         Taille en X,Y de la fenêtre
+    rng:
+        Générateur aléatoire à utiliser [par défaut un nouveau générateur]
+    path_width:
+        Largeurs minimale et maximale du circuit, à l'échelle de la fenêtre (voir
+        :func:`fix_points`) [par défaut :data:`MIN_PATH_WIDTH` et :data:`MAX_PATH_WIDTH`]
 
     Returns
     -------
@@ -209,11 +273,14 @@ def add_width(pathway: typing.List[tuple], colors: typing.Dict[str, pygame.Color
         Dictionnaire contenant le premier point supérieur ('point1'), le premier point inférieur
         ('point2') et toutes les :class:`classes.Border` du circuit ('bordures')
     """
+    if rng is None:
+        rng = np.random.default_rng()
+    min_path_width, max_path_width = path_width
     points_over = list()
     points_under = list()
     result = list()
-    delta = -round(MIN_PATH_WIDTH/12), round(MIN_PATH_WIDTH/12)
-    new_delta = min(MIN_PATH_WIDTH + random.randrange(*delta), MAX_PATH_WIDTH)
+    delta = -round(min_path_width/12), round(min_path_width/12)
+    new_delta = min(min_path_width + int(rng.integers(*delta)), max_path_width)
     # First point
     vect = Vector(pathway[1][0]-pathway[0][0], pathway[1][1]-pathway[0][1])
     vect.rotate_ip(90)
@@ -227,8 +294,8 @@ def add_width(pathway: typing.List[tuple], colors: typing.Dict[str, pygame.Color
         vect = Vector(point2[0]-point1[0], point2[1]-point1[1]) \
             + Vector(point3[0]-point2[0], point3[1]-point2[1])
         vect.rotate_ip(90)
-        new_delta = max(min(new_delta + random.randrange(*delta),
-                            MAX_PATH_WIDTH), MIN_PATH_WIDTH)
+        new_delta = max(min(new_delta + int(rng.integers(*delta)),
+                            max_path_width), min_path_width)
         vect.scale_to_length(new_delta)
         # points_over.append(point2)
         points_over.append((point2[0]-vect.x/2, point2[1]-vect.y/2))
@@ -261,8 +328,11 @@ def add_width(pathway: typing.List[tuple], colors: typing.Dict[str, pygame.Color
     return {"bordures": result, "point1": points_under[0], "point2": points_over[0]}
 
 
-def fix_points(scale_x: float, scale_y: float):
-    """Recalcule toutes les constantes en appliquant l'échelle donnée par la configuration
+def fix_points(scale_x: float, scale_y: float) -> dict:
+    """Calcule les constantes dépendant de la taille de la fenêtre, en appliquant l'échelle donnée
+    par la configuration
+
+    Les constantes du module ne sont pas modifiées.
 
     Parameters
     ----------
@@ -270,49 +340,66 @@ def fix_points(scale_x: float, scale_y: float):
         Echelle en x
     scale_y:
         Echelle en y
+
+    Returns
+    -------
+    :class:`dict`:
+        Dictionnaire contenant les points de référence du tracé, du départ à l'arrivée
+        ('pathway'), la longueur minimale d'un segment ('min_segment_length') et les largeurs
+        minimale et maximale du circuit ('path_width')
     """
-    global START_POINT, END_POINT, INTERMEDIATE_POINTS, MIN_SEGMENT_LENGTH
-    global MIN_PATH_WIDTH, MAX_PATH_WIDTH
     coef_g = (scale_x+scale_y)/2
 
     def update_pt(pt: (int, int)) -> (int, int):
         return pt[0]*scale_x, pt[1]*scale_y
-    START_POINT = update_pt(START_POINT)
-    END_POINT = update_pt(END_POINT)
-    INTERMEDIATE_POINTS = [update_pt(x) for x in INTERMEDIATE_POINTS]
-    MIN_SEGMENT_LENGTH = coef_g * MIN_SEGMENT_LENGTH
-    MIN_PATH_WIDTH = coef_g * MIN_PATH_WIDTH
-    MAX_PATH_WIDTH = coef_g * MAX_PATH_WIDTH
+    return {
+        "pathway": [update_pt(x) for x in [START_POINT] + INTERMEDIATE_POINTS + [END_POINT]],
+        "min_segment_length": coef_g * MIN_SEGMENT_LENGTH,
+        "path_width": (coef_g * MIN_PATH_WIDTH, coef_g * MAX_PATH_WIDTH)
+    }
 
 
 def circuit_creation(settings: Config) -> dict:
     """Fonction principale générant le circuit.
 
     C'est elle qui appelle toutes les autres fonctions dans le bon ordre et retourne un circuit
-    complet.
+    complet. Tous les tirages aléatoires utilisent un même générateur dérivé de l'option `seed`
+    de la configuration (voir :func:`random_generators`) : une même graine donne toujours le même
+    circuit.
 
     Parameters
     ----------
     settings:
-        Paramètres du programme, notamment pour l'échelle et les couleurs
+        Paramètres du programme, notamment pour l'échelle, les couleurs et la graine aléatoire
 
     Returns
     -------
     :class:`dict`:
         Dictionnaire contenant le premier point supérieur ('point1'), le premier point inférieur
-        ('point2') et toutes les :class:`classes.Border` du circuit ('bordures')
+        ('point2'), toutes les :class:`classes.Border` du circuit ('bordures'), l'index spatial
+        des bordures hors ligne d'arrivée ('index'), le tracé central du circuit ('centerline') et,
+        si les capteurs utilisés sont approchés, leur champ de distance ('field')
     """
-    fix_points(settings.scale_x, settings.scale_y)
-    pathway = [START_POINT] + INTERMEDIATE_POINTS + [END_POINT]
+    constants = fix_points(settings.scale_x, settings.scale_y)
+    rng = random_generators(settings.seed)[0]
+    pathway = constants["pathway"]
     for _ in range(GENERATIONS_NUMBER):
         index2 = 0
         last_move = [-1, 1]
         for _ in range(len(pathway)-1):
-            if calc_distance(pathway[index2], pathway[index2+1]) > MIN_SEGMENT_LENGTH:
+            if calc_distance(pathway[index2], pathway[index2+1]) > constants["min_segment_length"]:
                 line = pathway[index2], pathway[index2+1]
                 new_point, last_move = generate_point(
-                    *line, settings.screen_size, last_move)
+                    *line, settings.screen_size, last_move, rng, constants["path_width"][1])
                 pathway.insert(index2+1, new_point)
                 index2 += 1
             index2 += 1
-    return add_width(pathway, settings.colors, settings.screen_size)
+    circuit = add_width(pathway, settings.colors, settings.screen_size, rng,
+                        constants["path_width"])
+    segments = segments_array(circuit["bordures"][:-1])
+    circuit["index"] = BorderGrid(segments, settings.screen_size)
+    circuit["centerline"] = Centerline(pathway, settings.screen_size)
+    circuit["field"] = None
+    if settings.sensors == "field":
+        circuit["field"] = DistanceField(segments, settings.screen_size, settings.field_resolution)
+    return circuit
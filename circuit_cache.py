@@ -0,0 +1,244 @@
+"""
+Cache des circuits sur le disque
+
+Générer un circuit, puis construire ses index spatiaux et son éventuel champ de distance, prend un
+temps non négligeable à chaque lancement. Un circuit et ses index étant entièrement déterminés par
+sa graine, la taille de la fenêtre, les constantes de génération du module :mod:`circuit` et les
+paramètres par défaut des index (voir :data:`INDEX_CONSTANTS`), :class:`CircuitCache` l'enregistre
+dans un fichier numpy (.npz) identifié par ces paramètres, et le recharge directement lors des
+lancements suivants.
+
+Les couleurs ne sont pas enregistrées : elles sont reprises du thème utilisé au chargement.
+
+Des séries entières de circuits peuvent aussi être générées à l'avance, sur plusieurs processus,
+par :meth:`CircuitCache.generate`.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+import numpy as np
+import centerline as centerline_module
+import circuit as circuit_module
+import spatial_index as spatial_index_module
+from centerline import Centerline
+from classes import Border, segments_array
+from config_manager import Config
+from distance_field import DistanceField
+from spatial_index import BorderGrid, prefix_arrays, unprefix_arrays
+
+#: Dossier par défaut du cache
+DEFAULT_DIRECTORY = "circuits"
+#: Version du format des fichiers, à incrémenter à chaque changement de leur contenu
+CACHE_VERSION = 2
+#: Constantes du module :mod:`circuit` dont dépend la forme d'un circuit
+GENERATION_CONSTANTS = ("START_POINT", "END_POINT", "INTERMEDIATE_POINTS", "MIN_ANGLE_DEGREES",
+                        "MAX_ANGLE_DEGREES", "MIN_SEGMENT_LENGTH", "MAX_COST_COEF",
+                        "RANDOM_GENPOINT_AMPLITUDE", "MIN_PATH_WIDTH", "MAX_PATH_WIDTH",
+                        "CANDIDATES_BATCH", "MAX_CANDIDATES", "GENERATIONS_NUMBER")
+#: Constantes dont dépendent les index spatiaux enregistrés avec chaque circuit
+INDEX_CONSTANTS = ((spatial_index_module, "DEFAULT_CELL_SIZE"),
+                   (centerline_module, "DEFAULT_SEARCH_RADIUS"))
+
+
+def _init_worker():
+    """Initialise un processus de génération de :meth:`CircuitCache.generate`"""
+    # Seul le processus principal doit réagir à Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _generate_circuit(directory: str, settings: Config, seed: int) -> Tuple[int, str]:
+    """Génère un circuit et l'enregistre dans le cache, s'il n'y est pas déjà
+
+    Returns
+    -------
+    (:class:`int`, :class:`str`):
+        Graine et identifiant du circuit
+    """
+    settings = copy.copy(settings)
+    settings.seed = seed
+    cache = CircuitCache(directory)
+    key = cache.key(settings)
+    if not os.path.exists(cache.path(key)):
+        cache.save(key, circuit_module.circuit_creation(settings))
+    return seed, key
+
+
+class CircuitCache:
+    """Dossier contenant les circuits déjà générés, un fichier par circuit"""
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        """Initialise le cache
+
+        Parameters
+        ----------
+        directory:
+            Dossier contenant les fichiers du cache, créé au premier enregistrement [par défaut
+            :data:`DEFAULT_DIRECTORY`]
+        """
+        self.directory: str = directory  #: Dossier contenant les fichiers du cache
+
+    def key(self, settings: Config) -> Optional[str]:
+        """Calcule l'identifiant du circuit correspondant à une configuration
+
+        Parameters
+        ----------
+        settings:
+            Paramètres du programme, notamment la graine aléatoire et la taille de la fenêtre
+
+        Returns
+        -------
+        Optional[:class:`str`]:
+            Identifiant du circuit, ou None si aucune graine n'est fixée (le circuit n'est alors
+            pas reproductible)
+        """
+        if settings.seed is None:
+            return None
+        constants = {name: np.asarray(getattr(circuit_module, name), dtype=float).tolist()
+                     for name in GENERATION_CONSTANTS}
+        constants.update({name: float(getattr(module, name)) for module, name in INDEX_CONSTANTS})
+        description = json.dumps([CACHE_VERSION, settings.seed, list(settings.screen_size),
+                                  constants], sort_keys=True)
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()[:16]
+
+    def path(self, key: str) -> str:
+        """Donne le chemin du fichier correspondant à un identifiant"""
+        return os.path.join(self.directory, key + ".npz")
+
+    def save(self, key: str, circuit: dict):
+        """Enregistre un circuit dans le cache
+
+        Le fichier est d'abord écrit sous un nom temporaire puis renommé, pour qu'un fichier
+        incomplet ne soit jamais lu.
+
+        Parameters
+        ----------
+        key:
+            Identifiant du circuit (voir :meth:`key`)
+        circuit:
+            Dictionnaire du circuit, tel que retourné par :func:`circuit.circuit_creation`
+        """
+        arrays = {
+            "borders": segments_array(circuit["bordures"]),
+            "points": np.array([circuit["point1"], circuit["point2"]], dtype=float),
+        }
+        arrays.update(prefix_arrays("index_", circuit["index"].to_arrays()))
+        arrays.update(prefix_arrays("centerline_", circuit["centerline"].to_arrays()))
+        if circuit["field"] is not None:
+            arrays.update(prefix_arrays("field_", circuit["field"].to_arrays()))
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.path(key) + ".tmp"
+        with open(temporary, "wb") as myfile:
+            np.savez(myfile, **arrays)
+        os.replace(temporary, self.path(key))
+
+    def load(self, key: str, settings: Config) -> Optional[dict]:
+        """Charge un circuit depuis le cache
+
+        Si les capteurs utilisés sont approchés et que le champ de distance enregistré manque ou
+        n'a pas la bonne résolution, il est recalculé puis enregistré à son tour.
+
+        Parameters
+        ----------
+        key:
+            Identifiant du circuit (voir :meth:`key`)
+        settings:
+            Paramètres du programme, notamment pour les couleurs et les capteurs
+
+        Returns
+        -------
+        Optional[:class:`dict`]:
+            Dictionnaire du circuit, dans le même format que :func:`circuit.circuit_creation`, ou
+            None si le circuit n'est pas dans le cache
+        """
+        try:
+            with np.load(self.path(key), allow_pickle=False) as data:
+                arrays = dict(data)
+        except FileNotFoundError:
+            return None
+        borders = [Border(tuple(b[:2]), tuple(b[2:]), settings.colors["borders"])
+                   for b in arrays["borders"].tolist()]
+        borders[-2].color = settings.colors["border-begin"]
+        borders[-1].color = settings.colors["border-end"]
+        point1, point2 = (tuple(p) for p in arrays["points"].tolist())
+        circuit = {
+            "bordures": borders,
+            "point1": point1,
+            "point2": point2,
+            "index": BorderGrid.from_arrays(unprefix_arrays("index_", arrays)),
+            "centerline": Centerline.from_arrays(unprefix_arrays("centerline_", arrays),
+                                                 settings.screen_size),
+            "field": None
+        }
+        if settings.sensors == "field":
+            field = unprefix_arrays("field_", arrays)
+            if field and field["geometry"][2] == settings.field_resolution:
+                circuit["field"] = DistanceField.from_arrays(field)
+            else:
+                circuit["field"] = DistanceField(circuit["index"].segments, settings.screen_size,
+                                                 settings.field_resolution)
+                self.save(key, circuit)
+        return circuit
+
+    def get(self, settings: Config) -> dict:
+        """Charge le circuit correspondant à une configuration, ou le génère et l'enregistre s'il
+        n'est pas encore dans le cache
+
+        Parameters
+        ----------
+        settings:
+            Paramètres du programme
+
+        Returns
+        -------
+        :class:`dict`:
+            Dictionnaire du circuit (voir :func:`circuit.circuit_creation`)
+        """
+        key = self.key(settings)
+        if key is None:
+            return circuit_module.circuit_creation(settings)
+        circuit = self.load(key, settings)
+        if circuit is None:
+            circuit = circuit_module.circuit_creation(settings)
+            self.save(key, circuit)
+        return circuit
+
+    def generate(self, settings: Config, seeds: Iterable[int],
+                 workers: int = 1) -> Iterator[Tuple[int, str]]:
+        """Génère une série de circuits et les enregistre dans le cache
+
+        Chaque circuit est enregistré dès qu'il est prêt, par le processus qui l'a généré : une
+        série interrompue n'est donc pas perdue, et les circuits déjà présents dans le cache ne
+        sont pas générés à nouveau.
+
+        Parameters
+        ----------
+        settings:
+            Paramètres du programme, dont seule la graine est remplacée pour chaque circuit
+        seeds:
+            Graines des circuits à générer
+        workers:
+            Nombre de processus de génération [par défaut 1, c'est-à-dire le processus principal]
+
+        Returns
+        -------
+        Iterator[(:class:`int`, :class:`str`)]:
+            Graine et identifiant de chaque circuit (voir :meth:`key`), dans l'ordre où ils sont
+            prêts
+        """
+        if workers <= 1:
+            for seed in seeds:
+                yield _generate_circuit(self.directory, settings, seed)
+            return
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(_generate_circuit, self.directory, settings, seed)
+                       for seed in seeds]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                pool.shutdown(cancel_futures=True)
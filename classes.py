@@ -6,16 +6,24 @@ neuronaux (:class:`Network`) et les neurones eux-même (:class:`Neuron`).
 """
 
 
+import copy
 import math
-import random
 from math import exp
-from typing import Optional, List
-import time
+from functools import lru_cache
+from typing import Optional, List, Tuple
 import pygame
 from pygame.math import Vector2 as Vector
-from numpy import arccos, array, dot, pi, cross
-from numpy.linalg import norm
-import draw
+import numpy as np
+from spatial_index import BorderGrid, point_segment_distances, ray_segment_distance
+from distance_field import DistanceField
+from centerline import Centerline
+
+#: Nombre d'étapes de simulation correspondant à une seconde de jeu
+TICKS_PER_SECOND = 20
+#: Distance à un mur en dessous de laquelle une voiture est considérée en collision
+CRASH_DISTANCE = 9
+#: Distance à la ligne d'arrivée en dessous de laquelle une voiture l'a atteinte
+FINISH_DISTANCE = 8
 
 
 def line_ray_intersection_point(ray_origin: (int, int), ray_direction: (int, int),
@@ -106,6 +114,148 @@ def sig(n: float, a=1):
     return (1/(1+exp(-a*n)))
 
 
+def segments_array(borders: List['Border']) -> np.ndarray:
+    """Convertit une liste de bordures en tableau NumPy de segments
+
+    Parameters
+    ----------
+    borders:
+        Liste des bordures à convertir
+
+    Returns
+    -------
+    :class:`numpy.ndarray`:
+        Tableau de taille (S, 4), chaque ligne contenant les coordonnées (xA, yA, xB, yB) d'une
+        bordure
+    """
+    if len(borders) == 0:
+        return np.empty((0, 4))
+    return np.array([(*b.start, *b.end) for b in borders], dtype=float)
+
+
+def batch_raytrace(positions: np.ndarray, rotations: np.ndarray, rays: List[int],
+                   segments: np.ndarray, max_distance: float,
+                   index: Optional[BorderGrid] = None,
+                   indices: Optional[np.ndarray] = None) -> np.ndarray:
+    """Calcule en une seule fois le raytracing de toute une population de voitures
+
+    Chaque rayon de chaque voiture est testé contre chaque segment, avec le même calcul
+    d'intersection que :func:`line_ray_intersection_point`, mais de manière vectorisée.
+    Si un index spatial est donné, chaque voiture ne teste que les segments proches d'elle.
+
+    Parameters
+    ----------
+    positions:
+        Positions des voitures, de taille (C, 2)
+    rotations:
+        Rotations absolues des voitures en degrés, de taille (C,)
+    rays:
+        Angles des rayons en degrés, relatifs à la voiture
+    segments:
+        Segments du circuit, de taille (S, 4) (voir :func:`segments_array`)
+    max_distance:
+        Distance maximum à prendre en compte
+    index:
+        Index spatial construit à partir des mêmes segments [par défaut aucun]
+    indices:
+        Segments proches de chaque voiture, déjà obtenus par :meth:`BorderGrid.candidates` avec un
+        rayon d'au moins `max_distance` [par défaut calculés à partir de `index`]
+
+    Returns
+    -------
+    :class:`numpy.ndarray`:
+        Matrice de taille (C, R) des distances réelles au mur le plus proche pour chaque rayon, ou
+        -1 si aucun mur n'est rencontré avant `max_distance`
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    rotations = np.asarray(rotations, dtype=float).reshape(-1)
+    angles = np.radians(rotations[:, None] + np.asarray(rays, dtype=float)[None, :])
+    result = np.full(angles.shape, -1.0)
+    if len(segments) == 0 or len(positions) == 0:
+        return result
+    # (C, R, 1) : direction des rayons, et sa normale v3 = (-dy, dx)
+    dir_x = np.cos(angles)[:, :, None]
+    dir_y = np.sin(angles)[:, :, None]
+    if index is None:
+        candidates = segments[None, :, :]  # (1, S, 4)
+        valid = True
+    else:
+        if indices is None:
+            indices = index.candidates(positions, max_distance)
+        candidates = segments[indices]  # (C, K, 4)
+        valid = (indices >= 0)[:, None, :]
+    # (C, 1, S) : vecteur v1 allant du début de chaque segment à la voiture
+    v1_x = (positions[:, 0, None] - candidates[:, :, 0])[:, None, :]
+    v1_y = (positions[:, 1, None] - candidates[:, :, 1])[:, None, :]
+    # (C, 1, S) : vecteur v2 de chaque segment
+    v2_x = (candidates[:, :, 2] - candidates[:, :, 0])[:, None, :]
+    v2_y = (candidates[:, :, 3] - candidates[:, :, 1])[:, None, :]
+    denom = v2_y * dir_x - v2_x * dir_y
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1 = (v2_x * v1_y - v2_y * v1_x) / denom
+        t2 = (v1_y * dir_x - v1_x * dir_y) / denom
+    hit = valid & (denom != 0) & (t1 >= 0) & (t2 >= 0) & (t2 <= 1)
+    nearest = np.where(hit, t1, np.inf).min(axis=2)
+    found = nearest <= max_distance
+    result[found] = nearest[found]
+    return result
+
+
+def split_genome(genome: np.ndarray, sizes: List[int]) -> (List[np.ndarray], List[np.ndarray]):
+    """Découpe un génome en matrices de poids et vecteurs de constantes, sans copie
+
+    Le génome contient d'abord les poids entre chaque couche et la suivante (ligne par ligne),
+    puis les constantes de chaque couche. Les dernières dimensions du génome sont découpées, ce
+    qui permet aussi de découper toute une population de génomes empilés.
+
+    Parameters
+    ----------
+    genome:
+        Génome à découper, de taille (..., P)
+    sizes:
+        Nombre de neurones de chaque couche
+
+    Returns
+    -------
+    (List[:class:`numpy.ndarray`], List[:class:`numpy.ndarray`]):
+        Les vues sur les poids, de taille (..., n, n+1), et sur les constantes, de taille (..., n)
+    """
+    prefix = genome.shape[:-1]
+    weights, biases = [], []
+    offset = 0
+    for size1, size2 in zip(sizes, sizes[1:]):
+        weights.append(genome[..., offset:offset+size1*size2].reshape(prefix + (size1, size2)))
+        offset += size1*size2
+    for size in sizes:
+        biases.append(genome[..., offset:offset+size])
+        offset += size
+    return weights, biases
+
+
+@lru_cache()
+def genome_bounds(sizes: Tuple[int]) -> (np.ndarray, np.ndarray):
+    """Donne les bornes de tirage aléatoire de chaque paramètre d'un génome
+
+    Les poids sont tirés entre -2.0 et 2.0, et les constantes entre -1.0 et 1.0.
+
+    Parameters
+    ----------
+    sizes:
+        Nombre de neurones de chaque couche
+
+    Returns
+    -------
+    (:class:`numpy.ndarray`, :class:`numpy.ndarray`):
+        Les bornes inférieures et supérieures, en lecture seule
+    """
+    weights_count = sum(n1*n2 for n1, n2 in zip(sizes, sizes[1:]))
+    low = np.concatenate([np.full(weights_count, -2.0), np.full(sum(sizes), -1.0)])
+    low.setflags(write=False)
+    high = -low
+    high.setflags(write=False)
+    return low, high
+
+
 class Border:
     """Représente une bordure de circuit
 
@@ -140,10 +290,22 @@ class Car:
     Celle classe contient toutes les méthodes nécessaires à la création et la gestion de la voiture,
     pour la faire évoluer, récupérer les valeurs de son raytracing, et la remettre à zéro à la fin
     d'une évolution.
+
+    La voiture ne stocke pas elle-même son état : c'est une vue sur une case d'une
+    :class:`CarFleet`, qui regroupe l'état de toutes les voitures dans des tableaux NumPy et
+    partage les données du circuit entre elles. Une voiture créée directement possède sa propre
+    flotte d'une seule voiture.
     """
 
+    __slots__ = ("color", "fleet", "slot")
+
+    #: Angles des rayons (raytracing)
+    rays: Tuple[int] = (-70, -50, -30, -10, 10, 30, 50, 70)
+    rays_length: int = 80  #: Longueur des rayons du raytracing
+
     def __init__(self, circuit: List[Border], color: pygame.Color, abs_rotation: float = 0,
-                 starting_pos: tuple = (80, 140)):
+                 starting_pos: tuple = (80, 140), index: Optional[BorderGrid] = None,
+                 field: Optional[DistanceField] = None):
         """Initialise la voiture
 
         Parameters
@@ -156,53 +318,202 @@ class Car:
             Rotation par rapport au plan de la voiture [par défaut sud]
         starting_pos:
             Position de départ de la voiture en (x,y) [par défaut (80, 140)]
+        index:
+            Index spatial des bordures du circuit, hors ligne d'arrivée [par défaut aucun]
+        field:
+            Champ de distance du circuit, pour des capteurs approchés [par défaut aucun]
         """
         self.color: pygame.Color = color  #: Couleur de la voiture
-        self.position: (int, int) = list(starting_pos)  #: Position actuelle
-        self.init_pos: (int, int) = starting_pos  #: Position de départ
-        self.init_rotation: float = abs_rotation  #: Rotation de départ
-        self.abs_rotation: float = abs_rotation  #: Rotation actuelle
-        #: Liste des bordures du circuit
-        self.circuit: List[Border] = circuit[:-1]
-        self.last_border: Border = circuit[-1]  #: Ligne d'arrivée du circuit
-        self.start_time: float = time.time()  #: Timestamp de création de la voiture
-        self.death_time: float = None  #: Timestamp de la mort de la voiture
-        self.distance: float = 0  #: Distance parcourue depuis le début du circuit
-        self.rays: List[int] = [-70, -50, -30, -10, 10,
-                                30, 50, 70]  #: Angles des rayons (raytracing)
-        self.rays_length: int = 80  #: Longueur des rayons du raytracing
+        #: Flotte contenant l'état de la voiture
+        self.fleet: CarFleet = CarFleet(circuit, 1, starting_pos, abs_rotation, index, field)
+        self.slot: int = 0  #: Indice de la voiture dans sa flotte
+
+    @classmethod
+    def from_fleet(cls, fleet: 'CarFleet', slot: int, color: pygame.Color) -> 'Car':
+        """Crée une vue sur une voiture d'une flotte existante
+
+        Parameters
+        ----------
+        fleet:
+            Flotte contenant l'état de la voiture
+        slot:
+            Indice de la voiture dans la flotte
+        color:
+            Couleur de la voiture
+
+        Returns
+        -------
+        :class:`Car`:
+            La voiture correspondante
+        """
+        car = cls.__new__(cls)
+        car.color = color
+        car.fleet = fleet
+        car.slot = slot
+        return car
+
+    @property
+    def position(self) -> np.ndarray:
+        """Position actuelle, en (x, y)"""
+        return self.fleet.positions[self.slot]
+
+    @position.setter
+    def position(self, position: (float, float)):
+        self.fleet.positions[self.slot] = position
+        self.fleet.sensed[self.slot] = False
+        self.fleet.nearby_rows[self.slot] = -1
+
+    @property
+    def abs_rotation(self) -> float:
+        """Rotation actuelle, en degrés"""
+        return float(self.fleet.rotations[self.slot])
+
+    @abs_rotation.setter
+    def abs_rotation(self, rotation: float):
+        self.fleet.rotations[self.slot] = rotation
+        self.fleet.sensed[self.slot] = False
+
+    @property
+    def distance(self) -> float:
+        """Distance parcourue depuis le début du circuit"""
+        return float(self.fleet.distances[self.slot])
+
+    @distance.setter
+    def distance(self, distance: float):
+        self.fleet.distances[self.slot] = distance
+
+    @property
+    def ticks(self) -> int:
+        """Nombre d'étapes de simulation vécues par la voiture, qui sert d'horloge"""
+        return int(self.fleet.ticks[self.slot])
+
+    @ticks.setter
+    def ticks(self, ticks: int):
+        self.fleet.ticks[self.slot] = ticks
+
+    @property
+    def progress(self) -> float:
+        """Distance le long du tracé central entre le départ et la voiture (voir
+        :meth:`CarFleet.track`)"""
+        return float(self.fleet.progress[self.slot])
+
+    @property
+    def alive(self) -> bool:
+        """Indique si la voiture n'est pas encore rentrée dans un mur"""
+        return bool(self.fleet.alive[self.slot])
+
+    @alive.setter
+    def alive(self, alive: bool):
+        self.fleet.alive[self.slot] = alive
+
+    @property
+    def sensors(self) -> Optional[np.ndarray]:
+        """Cache des distances de raytracing, rempli par :meth:`sense` ou
+        :meth:`CarFleet.sense`, ou None s'il doit être recalculé"""
+        if not self.fleet.sensed[self.slot]:
+            return None
+        return self.fleet.sensors[self.slot]
+
+    @sensors.setter
+    def sensors(self, sensors: Optional[List[float]]):
+        if sensors is not None:
+            self.fleet.sensors[self.slot] = sensors
+        self.fleet.sensed[self.slot] = sensors is not None
+
+    @property
+    def init_pos(self) -> (float, float):
+        """Position de départ"""
+        return self.fleet.init_pos
+
+    @property
+    def init_rotation(self) -> float:
+        """Rotation de départ"""
+        return self.fleet.init_rotation
+
+    @property
+    def circuit(self) -> List[Border]:
+        """Liste des bordures du circuit, partagée par toute la flotte"""
+        return self.fleet.circuit
+
+    @property
+    def last_border(self) -> Border:
+        """Ligne d'arrivée du circuit"""
+        return self.fleet.last_border
+
+    @property
+    def index(self) -> Optional[BorderGrid]:
+        """Index spatial des bordures du circuit, utilisé par :meth:`raytrace`"""
+        return self.fleet.index
+
+    @property
+    def field(self) -> Optional[DistanceField]:
+        """Champ de distance du circuit, utilisé par :meth:`raytrace` à la place des bordures"""
+        return self.fleet.field
 
     @property
     def distances(self) -> List[float]:
         """Retourne la distance de raytracing pour chaque rayon défini
 
         L'angle des rayons est défini à la création de la voiture, et est le même pour toutes les
-        voitures.
+        voitures. Les valeurs sont lues depuis le cache de :meth:`sense`.
 
         Returns
         -------
         List[:class:`float`]
             Distance de raytracing pour chaque angle défini"""
-        return [self.raytrace(angle, self.rays_length, return_real_distance=True) for angle in self.rays]
+        return self.sense()
+
+    def sense(self) -> List[float]:
+        """Calcule le raytracing de la voiture une seule fois par étape de simulation
+
+        Les distances réelles sont mesurées jusqu'à `rays_length`, la plus grande portée utilisée,
+        puis gardées en cache jusqu'au prochain déplacement de la voiture. Les entrées du réseau
+        neuronal comme la détection des collisions sont ensuite calculées à partir de ce cache.
+
+        Returns
+        -------
+        List[:class:`float`]
+            Distance réelle de raytracing pour chaque angle défini, ou -1 si aucun mur n'est touché
+        """
+        if self.sensors is None:
+            self.sensors = [self.raytrace(angle, self.rays_length, return_real_distance=True)
+                            for angle in self.rays]
+        return self.sensors
+
+    def clone(self) -> 'Car':
+        """Crée une copie de la voiture
+
+        Seul l'état propre à la voiture est copié, dans une nouvelle flotte d'une seule voiture : la
+        liste des bordures, la ligne d'arrivée et l'index spatial du circuit, qui ne changent
+        jamais, sont partagés avec l'original.
+
+        Returns
+        -------
+        :class:`Car`:
+            La nouvelle voiture
+        """
+        return Car.from_fleet(self.fleet.extract(self.slot), 0, self.color)
 
     def reset(self):
         """Remet à zéro quelques options pour le prochain tour"""
-        self.start_time = time.time()
-        self.death_time = None
-        self.distance = 0
-        self.position = list(self.init_pos)
-        self.abs_rotation = self.init_rotation
+        self.fleet.reset([self.slot])
 
     def get_score(self):
-        """Calcule le score de la voiture en fonction de la distance parcourue et du temps passé
+        """Calcule le score de la voiture en fonction de sa progression et du temps passé
+
+        Si la flotte connaît le tracé central du circuit, la progression est la meilleure distance
+        atteinte le long de ce tracé (voir :meth:`CarFleet.track`), qui ne récompense pas les
+        voitures tournant en rond. Sinon, c'est la distance parcourue.
+
+        Le temps est mesuré en étapes de simulation (voir :data:`TICKS_PER_SECOND`) et non en
+        secondes réelles, pour qu'un même réseau obtienne toujours le même score quelle que soit la
+        vitesse de la machine.
 
         Returns
         -------
         :class:`int`:
             Score de la voiture à l'instant présent"""
-        d = time.time() if self.death_time is None else self.death_time
-        s = self.distance - (d-self.start_time)*5
-        return round(s)
+        return int(self.fleet.scores([self.slot])[0])
 
     def set_position(self, x: int, y: int):
         """Modifie la position absolue de la voiture
@@ -215,16 +526,35 @@ class Car:
             Nouvelle position de la voiture sur l'axe Y (ordonnée)"""
         self.position = [x, y]
 
-    def apply_vector(self, vector: Vector):
+    def apply_vector(self, vector: Vector) -> bool:
         """Applique un vecteur à la position de la voiture
 
+        Le déplacement est testé en continu contre les bordures du circuit : si le segment parcouru
+        traverse un mur, la voiture s'arrête contre celui-ci et meurt, même si le vecteur est plus
+        long que la distance de détection des collisions.
+
         Parameters
         ----------
         vector:
-            Vecteur à appliquer"""
-        self.position[0] += vector.x
-        self.position[1] += vector.y
-        self.distance += vector.length()
+            Vecteur à appliquer
+
+        Returns
+        -------
+        :class:`bool`:
+            Si la voiture a pu se déplacer sans traverser de mur"""
+        length = vector.length()
+        if length > 0:
+            hit = self.raytrace(vector.as_polar()[1], length, True, True)
+            if hit != -1:
+                vector = vector * (hit / length)
+                length = hit
+                self.alive = False
+        self.fleet.positions[self.slot] += (vector.x, vector.y)
+        self.fleet.distances[self.slot] += length
+        self.fleet.sensed[self.slot] = False
+        self.fleet.nearby_rows[self.slot] = -1
+        self.fleet.track([self.slot])
+        return self.alive
 
     def raytrace(self, angle: int, max_distance: int = 100, use_absolute_angle: bool = False,
                  return_real_distance: bool = False):
@@ -248,34 +578,44 @@ class Car:
             Retourne la distance entre 0 et 'max', 0 étant une collision immédiate et 'max' à la
             distance maximum, ou -1 si aucune collision. La valeur de 'max' est définie par le
             paramètre `max_distance` si `return_real_distance = True`, 1 sinon."""
-        assert all([isinstance(x, Border) for x in self.circuit]
-                   ), "La liste du circuit ne doit contenir que des objets de type Border"
         if not use_absolute_angle:
             angle = self.abs_rotation + angle
         angle = math.radians(angle)
-        # direction = vector(round(math.cos(angle), 5),
-        #                    round(math.sin(angle), 5))
-        ray_direction = Vector(2 * math.cos(angle), 2 * math.sin(angle))
-        ray_direction.scale_to_length(max_distance)
-        distances = []
-        for line in self.circuit:
-            distance1 = Vector(
-                line.start[0]-self.position[0], line.start[1]-self.position[1]).length()
-            distance2 = Vector(
-                line.end[0]-self.position[0], line.end[1]-self.position[1]).length()
-            if distance1 < max_distance or distance2 < max_distance:
-                distances.append(line_ray_intersection_point(self.position, ray_direction,
-                                                             line.start, line.end))
-        distances = [Vector(x[0]-self.position[0], x[1]-self.position[1]).length()
-                     for x in distances if len(x) != 0]
-        if len(distances) == 0:
-            return -1
-        shortest_distance = min(distances)
-        if shortest_distance > max_distance:
+        if self.field is not None:
+            distance = self.field.ray_distance(self.position[0], self.position[1],
+                                               math.cos(angle), math.sin(angle), max_distance)
+            if distance == -1 or return_real_distance:
+                return distance
+            return distance/max_distance
+        if self.index is not None:
+            distance = self.index.ray_distance(self.position[0], self.position[1],
+                                               math.cos(angle), math.sin(angle), max_distance)
+            if distance == -1 or return_real_distance:
+                return distance
+            return distance/max_distance
+        x, y = self.position.tolist()
+        dx, dy = math.cos(angle), math.sin(angle)
+        # Boîte englobante du rayon, réduite à chaque nouveau mur trouvé : seules les bordures qui
+        # la touchent peuvent encore être plus proches
+        best = max_distance
+        low_x, high_x = min(x, x + dx * best), max(x, x + dx * best)
+        low_y, high_y = min(y, y + dy * best), max(y, y + dy * best)
+        found = False
+        for segment in self.fleet.segments_list:
+            ax, ay, bx, by = segment
+            if (ax < low_x and bx < low_x) or (ax > high_x and bx > high_x) \
+                    or (ay < low_y and by < low_y) or (ay > high_y and by > high_y):
+                continue
+            distance = ray_segment_distance(x, y, dx, dy, segment)
+            if distance <= best:
+                best, found = distance, True
+                low_x, high_x = min(x, x + dx * best), max(x, x + dx * best)
+                low_y, high_y = min(y, y + dy * best), max(y, y + dy * best)
+        if not found:
             return -1
         if return_real_distance:
-            return shortest_distance
-        return shortest_distance/max_distance
+            return best
+        return best/max_distance
 
     def direction_vector(self) -> Vector:
         """Renvoie un vecteur unitaire dans la direction de self.abs_rotation"""
@@ -293,13 +633,15 @@ class Car:
             Option d'affichage des rayons : sous forme de segment ('Ray'), de croix ('Cross'),
             ou aucun (None)
         """
+        # Import local : le module draw importe lui-même ce module
+        import draw
         for i, a in enumerate(self.distances):
             if a != -1:
                 if display_rays is not None:
                     draw.drawvec(screen, self, self.rays[i], a, display_rays)
-            if 0 <= a <= 9:
+            if 0 <= a <= CRASH_DISTANCE:
                 return 0
-        return self.distance_to_segment(self.last_border) > 8
+        return self.distance_to_segment(self.last_border) > FINISH_DISTANCE
 
     def distance_to_segment(self, line: Border) -> float:
         """Retourne la distance la plus petite entre la voiture et un segment
@@ -309,14 +651,304 @@ class Car:
         line:
             Bordure définissant le segment à vérifier
         """
-        P, A, B = array(self.position), array(line.start), array(line.end)
-        if all(A == P) or all(B == P):
-            return 0
-        if arccos(dot((P - A) / norm(P - A), (B - A) / norm(B - A))) > pi / 2:
-            return norm(P - A)
-        if arccos(dot((P - B) / norm(P - B), (A - B) / norm(A - B))) > pi / 2:
-            return norm(P - B)
-        return round(norm(cross(A-B, A-P))/norm(B-A), 3)
+        return float(point_segment_distances(self.position, segments_array([line]))[0, 0])
+
+
+class CarFleet:
+    """Ensemble de voitures dont l'état est stocké colonne par colonne
+
+    Les positions, rotations, distances parcourues, états (vivante ou non), horloges et
+    raytracings de toutes les voitures sont rangés dans des tableaux NumPy, indexés par le numéro
+    de case de chaque voiture. Les données du circuit ne sont stockées qu'une fois pour toute la
+    flotte, la mémoire utilisée par voiture ne dépend donc pas de la taille du circuit.
+
+    Chaque voiture reste accessible individuellement sous forme de :class:`Car`, grâce à
+    :meth:`car`.
+    """
+
+    def __init__(self, circuit: List[Border], size: int, starting_pos: tuple = (80, 140),
+                 abs_rotation: float = 0, index: Optional[BorderGrid] = None,
+                 field: Optional[DistanceField] = None,
+                 centerline: Optional[Centerline] = None):
+        """Initialise la flotte, toutes les voitures étant à la position de départ
+
+        Parameters
+        ----------
+        circuit: List[Border]
+            liste des bordures composant le circuit
+        size:
+            Nombre de voitures de la flotte
+        starting_pos:
+            Position de départ des voitures en (x,y) [par défaut (80, 140)]
+        abs_rotation:
+            Rotation de départ des voitures [par défaut sud]
+        index:
+            Index spatial des bordures du circuit, hors ligne d'arrivée [par défaut aucun]
+        field:
+            Champ de distance du circuit, hors ligne d'arrivée : s'il est donné, les capteurs et la
+            proximité des murs sont approchés à partir de celui-ci [par défaut aucun]
+        centerline:
+            Tracé central du circuit, pour mesurer la progression des voitures [par défaut aucun]
+        """
+        assert all([isinstance(x, Border) for x in circuit]
+                   ), "La liste du circuit ne doit contenir que des objets de type Border"
+        #: Liste des bordures du circuit
+        self.circuit: List[Border] = circuit[:-1]
+        self.last_border: Border = circuit[-1]  #: Ligne d'arrivée du circuit
+        #: Index spatial des bordures du circuit
+        self.index: Optional[BorderGrid] = index
+        #: Champ de distance du circuit, pour des capteurs approchés
+        self.field: Optional[DistanceField] = field
+        #: Tracé central du circuit, pour mesurer la progression des voitures
+        self.centerline: Optional[Centerline] = centerline
+        #: Progression correspondant à la position de départ
+        self.start_progress: float = 0
+        if centerline is not None:
+            self.start_progress = float(centerline.project([starting_pos])[0][0])
+        #: Segments des bordures, de taille (S, 4) (voir :func:`segments_array`)
+        self.segments: np.ndarray = segments_array(self.circuit) if index is None \
+            else index.segments
+        #: Mêmes segments sous forme de tuples, pour le raytracing d'une seule voiture
+        self.segments_list: List[Tuple[float, float, float, float]] = [
+            tuple(segment) for segment in self.segments.tolist()]
+        self.init_pos: (int, int) = starting_pos  #: Position de départ
+        self.init_rotation: float = abs_rotation  #: Rotation de départ
+        self.positions: np.ndarray = np.empty((size, 2))  #: Positions actuelles, de taille (N, 2)
+        self.rotations: np.ndarray = np.empty(size)  #: Rotations actuelles, en degrés
+        self.distances: np.ndarray = np.empty(size)  #: Distances parcourues
+        self.ticks: np.ndarray = np.empty(size, dtype=int)  #: Nombre d'étapes vécues
+        self.alive: np.ndarray = np.empty(size, dtype=bool)  #: Voitures encore en vie
+        #: Progression actuelle le long du tracé central (voir :meth:`track`)
+        self.progress: np.ndarray = np.empty(size)
+        #: Meilleure progression atteinte depuis le départ
+        self.best_progress: np.ndarray = np.empty(size)
+        #: Étape à laquelle la meilleure progression a augmenté pour la dernière fois
+        self.progress_ticks: np.ndarray = np.empty(size, dtype=int)
+        #: Distances de raytracing, de taille (N, R)
+        self.sensors: np.ndarray = np.empty((size, len(Car.rays)))
+        #: Voitures dont le raytracing est à jour dans `sensors`
+        self.sensed: np.ndarray = np.empty(size, dtype=bool)
+        #: Segments proches des voitures lors du dernier raytracing (voir :meth:`sense`)
+        self.nearby: np.ndarray = np.empty((0, 1), dtype=np.intp)
+        #: Ligne de `nearby` correspondant à chaque voiture, ou -1 si la voiture n'était pas
+        #: concernée par le dernier raytracing ou a bougé depuis
+        self.nearby_rows: np.ndarray = np.full(size, -1, dtype=np.intp)
+        self.reset()
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def car(self, slot: int, color: pygame.Color) -> Car:
+        """Donne la voiture d'indice donné, sous forme de :class:`Car`
+
+        Parameters
+        ----------
+        slot:
+            Indice de la voiture dans la flotte
+        color:
+            Couleur de la voiture
+        """
+        return Car.from_fleet(self, slot, color)
+
+    def reset(self, slots: Optional[np.ndarray] = None):
+        """Remet des voitures à leur position de départ pour le prochain tour
+
+        Parameters
+        ----------
+        slots:
+            Indices des voitures à remettre à zéro [par défaut toutes]
+        """
+        if slots is None:
+            slots = slice(None)
+        self.positions[slots] = self.init_pos
+        self.rotations[slots] = self.init_rotation
+        self.distances[slots] = 0
+        self.ticks[slots] = 0
+        self.alive[slots] = True
+        self.sensed[slots] = False
+        self.nearby_rows[slots] = -1
+        self.progress[slots] = self.start_progress
+        self.best_progress[slots] = self.start_progress
+        self.progress_ticks[slots] = 0
+
+    def extract(self, slot: int) -> 'CarFleet':
+        """Copie une voiture dans une nouvelle flotte d'une seule voiture
+
+        Les données du circuit sont partagées avec la flotte d'origine.
+
+        Parameters
+        ----------
+        slot:
+            Indice de la voiture à copier
+        """
+        fleet = copy.copy(self)
+        for name in ("positions", "rotations", "distances", "ticks", "alive", "progress",
+                     "best_progress", "progress_ticks", "sensors", "sensed", "nearby_rows"):
+            setattr(fleet, name, getattr(self, name)[slot:slot+1].copy())
+        return fleet
+
+    def sense(self, slots: np.ndarray):
+        """Calcule en une seule fois le raytracing de plusieurs voitures
+
+        Parameters
+        ----------
+        slots:
+            Indices des voitures à mettre à jour
+        """
+        if len(slots) == 0:
+            return
+        if self.field is not None:
+            self.sensors[slots] = self.field.batch_ray_distances(
+                self.positions[slots], self.rotations[slots], Car.rays, Car.rays_length)
+            self.sensed[slots] = True
+            return
+        indices = None
+        if self.index is not None:
+            # Conservés pour le test des déplacements dans :meth:`move`
+            indices = self.index.candidates(self.positions[slots], Car.rays_length)
+            self.nearby = indices
+            # Les lignes des autres voitures désignaient l'ancien tableau
+            self.nearby_rows[:] = -1
+            self.nearby_rows[slots] = np.arange(len(indices))
+        self.sensors[slots] = batch_raytrace(self.positions[slots], self.rotations[slots],
+                                             Car.rays, self.segments, Car.rays_length,
+                                             self.index, indices)
+        self.sensed[slots] = True
+
+    def collisions(self, slots: np.ndarray,
+                   wall_distance: Optional[float] = None) -> (np.ndarray, np.ndarray):
+        """Vérifie en une seule fois quelles voitures ont touché un mur ou la ligne d'arrivée
+
+        C'est l'équivalent vectorisé de :meth:`Car.detection`, à partir du raytracing en cache
+        (voir :meth:`sense`). Les voitures peuvent en plus être comparées à tous les murs proches,
+        et pas seulement à ceux vus par leurs rayons.
+
+        Parameters
+        ----------
+        slots:
+            Indices des voitures à vérifier, dont le raytracing doit être à jour
+        wall_distance:
+            Si donnée, distance minimale à tous les murs en dessous de laquelle une voiture est en
+            collision [par défaut aucune]
+
+        Returns
+        -------
+        (:class:`numpy.ndarray`, :class:`numpy.ndarray`):
+            Les masques booléens des voitures en collision avec un mur, et de celles ayant atteint
+            la ligne d'arrivée
+        """
+        sensors = self.sensors[slots]
+        crashed = ((sensors >= 0) & (sensors <= CRASH_DISTANCE)).any(axis=1)
+        positions = self.positions[slots]
+        if wall_distance is not None and self.field is not None:
+            crashed |= self.field.distances(positions) <= wall_distance
+        elif wall_distance is not None and len(self.circuit) > 0:
+            if self.index is None:
+                walls = self.segments
+            else:
+                indices = self.index.candidates(positions, wall_distance)
+                walls = self.index.segments[indices]
+                walls[indices < 0] = np.inf
+            with np.errstate(invalid="ignore"):
+                distances = point_segment_distances(positions, walls)
+            crashed |= np.nan_to_num(distances, nan=np.inf).min(axis=1) <= wall_distance
+        finish = segments_array([self.last_border])
+        finished = point_segment_distances(positions, finish)[:, 0] <= FINISH_DISTANCE
+        return crashed, finished
+
+    def move(self, slots: np.ndarray, turns: np.ndarray, speeds: np.ndarray) -> np.ndarray:
+        """Tourne puis fait avancer plusieurs voitures en une seule fois
+
+        C'est l'équivalent vectorisé d'une rotation suivie de :meth:`Car.apply_vector` dans la
+        direction de :meth:`Car.direction_vector`. Chaque voiture déplacée vit aussi une étape de
+        plus.
+
+        Comme pour :meth:`Car.apply_vector`, le segment parcouru par chaque voiture est testé contre
+        les bordures (un rayon par voiture, dans le sens du déplacement) : une voiture qui
+        traverserait un mur s'arrête contre lui et meurt, quelle que soit la longueur du pas.
+
+        Parameters
+        ----------
+        slots:
+            Indices des voitures à déplacer
+        turns:
+            Rotation à appliquer à chaque voiture, en degrés
+        speeds:
+            Vitesse de chaque voiture, la longueur du déplacement étant le double de cette valeur
+
+        Returns
+        -------
+        :class:`numpy.ndarray`:
+            Masque booléen des voitures arrêtées par un mur pendant ce déplacement
+        """
+        speeds = np.broadcast_to(np.asarray(speeds, dtype=float), np.shape(slots))
+        self.rotations[slots] += turns
+        lengths = 2 * np.abs(speeds)
+        crashed = np.zeros(len(lengths), dtype=bool)
+        if len(self.circuit) > 0 and len(lengths) > 0:
+            headings = self.rotations[slots] + np.where(speeds < 0, 180, 0)
+            indices = None
+            rows = self.nearby_rows[slots]
+            if self.index is not None and self.field is None and (rows >= 0).all() \
+                    and lengths.max() <= Car.rays_length:
+                # Les voitures n'ont pas bougé depuis le raytracing : mêmes segments proches
+                indices = self.nearby[rows]
+            hits = batch_raytrace(self.positions[slots], headings, (0,), self.segments,
+                                  lengths.max(), self.index, indices)[:, 0]
+            crashed = (hits >= 0) & (hits < lengths)
+            lengths = np.where(crashed, hits, lengths)
+            self.alive[np.asarray(slots)[crashed]] = False
+        angles = np.radians(self.rotations[slots])
+        steps = np.copysign(lengths, speeds)
+        self.positions[slots, 0] += np.cos(angles) * steps
+        self.positions[slots, 1] += np.sin(angles) * steps
+        self.distances[slots] += lengths
+        self.ticks[slots] += 1
+        self.sensed[slots] = False
+        self.nearby_rows[slots] = -1
+        self.track(slots)
+        return crashed
+
+    def scores(self, slots: np.ndarray) -> np.ndarray:
+        """Version vectorisée de :meth:`Car.get_score`
+
+        Parameters
+        ----------
+        slots:
+            Indices des voitures dont on veut le score
+
+        Returns
+        -------
+        :class:`numpy.ndarray`:
+            Score de chaque voiture à l'instant présent, arrondi à l'entier le plus proche
+        """
+        if self.centerline is None:
+            travelled = self.distances[slots]
+        else:
+            travelled = self.best_progress[slots] - self.start_progress
+        return np.round(travelled - self.ticks[slots] / TICKS_PER_SECOND * 5).astype(int)
+
+    def track(self, slots: np.ndarray):
+        """Met à jour la progression de plusieurs voitures le long du tracé central
+
+        Chaque voiture est projetée sur le segment du tracé le plus proche d'elle (voir
+        :meth:`centerline.Centerline.project`). Sa meilleure progression, et l'étape à laquelle
+        elle a augmenté pour la dernière fois, permettent de repérer les voitures bloquées ou
+        tournant en rond. Rien n'est fait si la flotte ne connaît pas le tracé.
+
+        Parameters
+        ----------
+        slots:
+            Indices des voitures à mettre à jour
+        """
+        if self.centerline is None or len(slots) == 0:
+            return
+        progress = self.centerline.project(self.positions[slots])[0]
+        self.progress[slots] = progress
+        improved = progress > self.best_progress[slots]
+        slots = np.asarray(slots)[improved]
+        self.best_progress[slots] = progress[improved]
+        self.progress_ticks[slots] = self.ticks[slots]
 
 
 class Network:
@@ -328,55 +960,183 @@ class Network:
 
     Le but du programme étant d'obtenir un réseau neuronal le plus performant possible, ammenant sa
     voiture à la fin du circuit sans toucher aucune bordure.
+
+    Chaque couche est stockée sous forme de tableaux NumPy : une matrice de poids vers la couche
+    suivante, un vecteur de constantes et un vecteur de valeurs. Les poids et les constantes sont
+    des vues sur un unique tableau contigu, le génome (voir :func:`split_genome`), utilisé par les
+    opérateurs d'évolution. Les attributs `I_layer`, `layer_2`, `layer_3` et `layer_4` donnent une
+    vue neurone par neurone (:class:`Neuron`) de ces mêmes tableaux.
     """
 
-    def __init__(self, car: Car):
+    def __init__(self, car: Car, rng: Optional[np.random.Generator] = None):
         """
         Initialise le réseau neuronal
 
         Chaque couche du réseau se voit attribué un nombre fixe de neurones, tous initialisés de
-        manière aléatoire.
+        manière aléatoire : les poids entre -2.0 et 2.0, et les constantes entre -1.0 et 1.0.
 
         Parameters
         ----------
         car:
-            La voiture attribuée à ce réseau neuronal"""
-        self.I_layer = [Neuron(6) for _ in range(len(car.rays)+2)]
-        self.layer_2 = [Neuron(4) for _ in range(6)]
-        self.layer_3 = [Neuron(2) for _ in range(4)]
-        self.layer_4 = [Neuron(0) for _ in range(2)]
+            La voiture attribuée à ce réseau neuronal
+        rng:
+            Générateur aléatoire utilisé pour tirer le génome [par défaut un nouveau générateur]"""
+        if rng is None:
+            rng = np.random.default_rng()
+        sizes = [len(car.rays)+2, 6, 4, 2]
+        #: Valeurs actuelles des neurones de chaque couche
+        self.values: List[np.ndarray] = [np.zeros(n) for n in sizes]
+        #: Matrices des poids entre chaque couche et la suivante, de taille (n, n+1)
+        self.weights: List[np.ndarray] = []
+        #: Constantes des neurones de chaque couche
+        self.biases: List[np.ndarray] = []
+        low, high = genome_bounds(tuple(sizes))
+        self.genome = rng.uniform(low, high)
         self.score: int = 0  #: Score final du réseau
-        self.dead: bool = False  #: Indique si la voiture est rentrée dans un mur
         self.car: Car = car  #: Voiture liée au réseau
 
+    @classmethod
+    def from_parameters(cls, car: Car, genome: np.ndarray,
+                        values: List[np.ndarray]) -> 'Network':
+        """Crée un réseau à partir d'un génome et de valeurs existants, sans tirer de génome
+        aléatoire
+
+        Les tableaux donnés sont utilisés directement, sans copie.
+
+        Parameters
+        ----------
+        car:
+            La voiture attribuée à ce réseau neuronal
+        genome:
+            Génome du réseau (voir :attr:`genome`)
+        values:
+            Valeurs des neurones de chaque couche
+
+        Returns
+        -------
+        :class:`Network`:
+            Le nouveau réseau
+        """
+        net = cls.__new__(cls)
+        net.values = values
+        net.genome = genome
+        net.score = 0
+        net.car = car
+        return net
+
+    @property
+    def dead(self) -> bool:
+        """Indique si la voiture est rentrée dans un mur (voir :attr:`Car.alive`)"""
+        return not self.car.alive
+
+    @dead.setter
+    def dead(self, dead: bool):
+        self.car.alive = not dead
+
+    @property
+    def sizes(self) -> List[int]:
+        """Nombre de neurones de chaque couche"""
+        return [len(v) for v in self.values]
+
+    @property
+    def genome(self) -> np.ndarray:
+        """Tous les poids puis toutes les constantes du réseau, dans un seul tableau contigu
+
+        Modifier ce tableau modifie directement le réseau. Lui assigner un nouveau tableau fait
+        pointer les poids et les constantes du réseau vers celui-ci, sans copie."""
+        return self._genome
+
+    @genome.setter
+    def genome(self, genome: np.ndarray):
+        self._genome = np.asarray(genome, dtype=float)
+        self.weights, self.biases = split_genome(self._genome, self.sizes)
+
+    def clone(self, car: Optional[Car] = None) -> 'Network':
+        """Crée une copie du réseau, beaucoup moins coûteuse qu'un `copy.deepcopy`
+
+        Seuls le génome et les valeurs des neurones sont copiés ; la voiture est dupliquée avec
+        :meth:`Car.clone`, qui partage les données du circuit.
+
+        Parameters
+        ----------
+        car:
+            Voiture à attribuer à la copie [par défaut une copie de la voiture du réseau]
+
+        Returns
+        -------
+        :class:`Network`:
+            Le nouveau réseau
+        """
+        clone = Network.__new__(Network)
+        clone.values = [v.copy() for v in self.values]
+        clone.genome = self.genome.copy()
+        clone.score = self.score
+        clone.car = self.car.clone() if car is None else car
+        return clone
+
+    def __getstate__(self) -> dict:
+        # Les poids et constantes sont des vues sur le génome : ils sont recréés à partir de
+        # celui-ci lors d'une copie, pour que la copie partage à nouveau sa mémoire avec son génome
+        state = self.__dict__.copy()
+        del state["weights"], state["biases"]
+        return state
+
+    def __setstate__(self, state: dict):
+        genome = state.pop("_genome")
+        self.__dict__.update(state)
+        self.genome = genome
+
+    def _layer(self, layer: int) -> List['Neuron']:
+        return [Neuron(self, layer, i) for i in range(len(self.values[layer]))]
+
+    @property
+    def I_layer(self) -> List['Neuron']:
+        """Couche d'entrée, neurone par neurone"""
+        return self._layer(0)
+
+    @property
+    def layer_2(self) -> List['Neuron']:
+        """Deuxième couche, neurone par neurone"""
+        return self._layer(1)
+
+    @property
+    def layer_3(self) -> List['Neuron']:
+        """Troisième couche, neurone par neurone"""
+        return self._layer(2)
+
+    @property
+    def layer_4(self) -> List['Neuron']:
+        """Couche de sortie, neurone par neurone"""
+        return self._layer(3)
+
     def update(self):
         """Recalcule les valeurs de chaque neurone à partir du raytracing de la voiture
 
+        Le raytracing est lu depuis le cache de la voiture (voir :meth:`Car.sense`), partagé avec
+        la détection des collisions.
         Le raytracing renvoie un certain nombre fixe de valeurs entre 0 et 1, correspondant à la
         distance du mur le plus proche vu par chaque angle. Deux autres neurones sont remplis avec
         la distance et l'angle actuel de la voiture, permettant un calcul semi récursif.
+
+        Chaque couche est ensuite calculée par un produit matrice-vecteur, auquel on ajoute les
+        constantes avant de normaliser avec la fonction sigmoide (coefficient 3).
         """
-        for i, n in enumerate(self.I_layer[:-2]):
-            n.value = max(0, self.car.raytrace(
-                self.car.rays[i], self.car.rays_length, return_real_distance=False))
-        self.I_layer[-2].value = self.layer_4[0].value
-        self.I_layer[-1].value = self.layer_4[1].value
-        for i, neuron in enumerate(self.layer_2):
-            neuron.update_value(self.I_layer, i)
-        for i, neuron in enumerate(self.layer_3):
-            neuron.update_value(self.layer_2, i)
-        for i, neuron in enumerate(self.layer_4):
-            neuron.update_value(self.layer_3, i)
+        inputs = self.values[0]
+        inputs[:-2] = np.maximum(0, self.car.distances) / self.car.rays_length
+        inputs[-2:] = self.values[-1]
+        for i, weights in enumerate(self.weights):
+            self.values[i+1][:] = 1 / (1 + np.exp(-3 * (self.values[i] @ weights
+                                                         + self.biases[i+1])))
 
     @property
     def direction(self) -> float:  # between -2 and 2
         """Direction de la voiture, entre -2.0 et 2.0"""
-        return round(self.layer_4[0].value*4-2, 3)
+        return round(float(self.values[-1][0])*4-2, 3)
 
     @property
     def engine(self) -> float:  # between 0.2 and 1
         """Vitesse de la voiture, entre 0.2 et 1"""
-        return min(1, (self.layer_4[1].value*1.2)+0.2)
+        return min(1, (float(self.values[-1][1])*1.2)+0.2)
 
     def from_json(self, data: dict):
         """Recrée le réseau et tous ses neurones à partir de données préalablement enregistrées
@@ -388,18 +1148,11 @@ class Network:
         """
         if data is None:
             return
-        self.I_layer = [Neuron(0) for _ in range(data["layers"][0])]
-        self.layer_2 = [Neuron(0) for _ in range(data["layers"][1])]
-        self.layer_3 = [Neuron(0) for _ in range(data["layers"][2])]
-        self.layer_4 = [Neuron(0) for _ in range(data["layers"][3])]
-        for e, n in enumerate(data["neurons"][0]):
-            self.I_layer[e].from_json(n)
-        for e, n in enumerate(data["neurons"][1]):
-            self.layer_2[e].from_json(n)
-        for e, n in enumerate(data["neurons"][2]):
-            self.layer_3[e].from_json(n)
-        for e, n in enumerate(data["neurons"][3]):
-            self.layer_4[e].from_json(n)
+        layers = data["neurons"]
+        self.values = [np.array([n["value"] for n in layer], dtype=float) for layer in layers]
+        self.genome = np.concatenate(
+            [np.ravel([n["weight"] for n in layer]) for layer in layers[:-1]]
+            + [[n["bias"] for n in layer] for layer in layers]).astype(float)
 
 
 class Neuron:
@@ -408,47 +1161,58 @@ class Neuron:
 
     Il possède une valeur, une constante, et une liste de poids régulant l'influence de ce neurone
     sur la couche suivante.
+
+    Le neurone ne stocke rien lui-même : c'est une vue sur les tableaux de son réseau, toute
+    modification est donc directement appliquée au réseau.
     """
 
-    def __init__(self, weigth_len: int):
-        """Initialise le neurone
+    __slots__ = ("network", "layer", "index")
 
-        La valeur est fixée à 0, la liste des poids est tirée aléatoirement entre -2.0 et 2.0 pour
-        chaque poids, et la constante est aléatoire entre -1.0 et 1.0.
+    def __init__(self, network: Network, layer: int, index: int):
+        """Initialise la vue sur le neurone
 
         Parameters
         ----------
-        weigth_len:
-            Nombre de poids de la couche suivante
+        network:
+            Réseau contenant le neurone
+        layer:
+            Indice de la couche du neurone
+        index:
+            Indice du neurone dans sa couche
         """
-        self.value: float = 0  #: Valeur actuelle du neurone
-        self.weight = [random.random()*4-2 for i in range(weigth_len)]
-        self.bias: float = random.random()*2-1  #: Constante du neurone
+        self.network = network
+        self.layer = layer
+        self.index = index
 
-    def normalize(self):
-        """Normalise la valeur actuelle du neurone pour s'assurer qu'elle soit entre 0 et 1
+    @property
+    def value(self) -> float:
+        """Valeur actuelle du neurone"""
+        return self.network.values[self.layer][self.index]
 
-        On utilise ici la fonction sigmoide pour plus de modularité, avec un coefficient de 3."""
-        self.value = sig(self.value, 3)
+    @value.setter
+    def value(self, value: float):
+        self.network.values[self.layer][self.index] = value
 
-    def update_value(self, neurons: List['Neuron'], target):
-        """Recalcule la valeur du neurone à partir des neurones de la couche précédente
+    @property
+    def weight(self) -> np.ndarray:
+        """Poids du neurone vers chaque neurone de la couche suivante (vide pour la sortie)"""
+        if self.layer == len(self.network.weights):
+            return np.empty(0)
+        return self.network.weights[self.layer][self.index]
 
-        La valeur est calculée en faisant la somme coefficientée de la valeur des autres neurones,
-        puis en y ajoutant la constante de ce neurone.
-        Pour finir, on passe par une normalisation de la valeur afin de la rendre utilisable.
+    @weight.setter
+    def weight(self, weight: List[float]):
+        if self.layer < len(self.network.weights):
+            self.network.weights[self.layer][self.index] = weight
 
-        Parameters
-        ----------
-        neurons:
-            Liste des neurones de la couche précédente
-        target:
-            Indice du neurone actuel, utilisé pour retrouver les bons poids dans la liste des poids
-            des précédents neurones
-        """
-        self.value = sum([x.value*x.weight[target]
-                          for x in neurons]) + self.bias
-        self.normalize()
+    @property
+    def bias(self) -> float:
+        """Constante du neurone"""
+        return self.network.biases[self.layer][self.index]
+
+    @bias.setter
+    def bias(self, bias: float):
+        self.network.biases[self.layer][self.index] = bias
 
     def from_json(self, data: dict):
         """Recrée le neurone à partir de données préalablement enregistrées
@@ -463,7 +1227,69 @@ class Neuron:
         self.bias = data["bias"]
 
     def __str__(self):
-        return str((self.value, self.weight, self.bias))
+        return str((self.value, list(self.weight), self.bias))
 
     def __repr__(self):
         return str(self.value)
+
+
+class Population:
+    """
+    Ensemble de réseaux neuronaux évalués en une seule fois
+
+    Les poids de tous les réseaux sont empilés dans des tenseurs à trois dimensions (réseau,
+    neurone, poids), de sorte qu'une seule multiplication matricielle par couche suffit à calculer
+    toute la population. Les tableaux de chaque :class:`Network` deviennent des vues sur ces
+    tenseurs : les réseaux restent utilisables individuellement, et toute modification est partagée.
+    """
+
+    def __init__(self, networks: List[Network]):
+        """Empile les réseaux donnés, qui doivent tous avoir les mêmes tailles de couches
+
+        Parameters
+        ----------
+        networks:
+            Réseaux neuronaux composant la population
+        """
+        self.networks: List[Network] = networks  #: Réseaux composant la population
+        #: Génomes de tous les réseaux, de taille (N, P)
+        self.genomes: np.ndarray = np.stack([net.genome for net in networks])
+        #: Poids de chaque couche, de taille (N, n, n+1), et constantes de chaque couche, de
+        #: taille (N, n), sous forme de vues sur les génomes
+        self.weights, self.biases = split_genome(self.genomes, networks[0].sizes)
+        #: Valeurs des neurones de chaque couche, de taille (N, n)
+        self.values: List[np.ndarray] = [np.stack([net.values[i] for net in networks])
+                                         for i in range(len(networks[0].values))]
+        for i, net in enumerate(networks):
+            net.values = [v[i] for v in self.values]
+            net.genome = self.genomes[i]
+
+    def update(self, alive: np.ndarray, distances: np.ndarray, rays_length: int):
+        """Recalcule les neurones de tous les réseaux en vie, comme :meth:`Network.update`
+
+        Parameters
+        ----------
+        alive:
+            Masque booléen de taille (N,) des réseaux à recalculer, les autres gardant leurs
+            valeurs
+        distances:
+            Distances réelles de raytracing des voitures en vie, de taille (nombre de vivants, R)
+        rays_length:
+            Longueur des rayons du raytracing
+        """
+        inputs = self.values[0]
+        inputs[alive, :-2] = np.maximum(0, distances) / rays_length
+        inputs[alive, -2:] = self.values[-1][alive]
+        for i, weights in enumerate(self.weights):
+            result = np.matmul(self.values[i][:, None, :], weights)[:, 0, :] + self.biases[i+1]
+            self.values[i+1][alive] = 1 / (1 + np.exp(-3 * result[alive]))
+
+    @property
+    def directions(self) -> np.ndarray:
+        """Direction de chaque voiture, entre -2.0 et 2.0 (voir :attr:`Network.direction`)"""
+        return np.round(self.values[-1][:, 0]*4-2, 3)
+
+    @property
+    def engines(self) -> np.ndarray:
+        """Vitesse de chaque voiture, entre 0.2 et 1 (voir :attr:`Network.engine`)"""
+        return np.minimum(1, (self.values[-1][:, 1]*1.2)+0.2)
@@ -5,6 +5,7 @@ C'est dans ce fichier que se trouve la classe :class:`Config` enregistrant toute
 configurations du programme, éditables dans le fichier 'settings.yaml'.
 """
 
+import os
 import re
 import json
 from typing import Optional
@@ -37,6 +38,28 @@ class Config():
     :var bool debug_mode: Utilisation du mode de débugage, qui liste les performances du programme
         et de chaque fonction appelée.
     :var bool autosave: Sauvegarde automatique du meilleure réseau neuronal à la fin du programme
+    :var int checkpoint_interval: Nombre de générations entre deux sauvegardes de toute la
+        population, reprise au lancement suivant (0 pour désactiver)
+    :var bool headless: Entraînement en mode automatique sans aucune fenêtre ni limite de FPS
+    :var int workers: Nombre de processus utilisés pour simuler chaque génération sans affichage
+    :var str sensors: Calcul des capteurs des voitures, exact ou à partir d'un champ de distance
+        précalculé (exact/field)
+    :var int field_resolution: Taille en pixels d'une case du champ de distance
+    :var float stall_time: Temps de jeu sans progression après lequel une voiture est éliminée, en
+        secondes (0 pour désactiver)
+    :var float plateau_time: Temps de jeu sans progression d'aucune voiture après lequel une
+        génération est arrêtée, en secondes (0 pour désactiver)
+    :var float max_generation_time: Temps de jeu maximal d'une génération, en secondes (0 pour
+        désactiver)
+    :var Optional[int] seed: Graine des générateurs aléatoires, pour reproduire le même circuit et
+        la même évolution (None pour une graine différente à chaque lancement)
+    :var Optional[str] circuit_cache: Dossier où enregistrer les circuits générés à partir d'une
+        graine fixée, pour les recharger directement aux lancements suivants (None pour désactiver)
+    :var int circuits_number: Nombre de circuits sur lesquels chaque génération est évaluée
+    :var str fitness_aggregation: Combinaison des scores obtenus sur les différents circuits
+        (mean/min/quantile)
+    :var float fitness_quantile: Quantile des scores utilisé par la combinaison 'quantile', entre
+        0 et 1
     """
 
     def __init__(self, conf: dict):
@@ -81,6 +104,40 @@ class Config():
         assert isinstance(conf["autosave"],
                           bool), "Invalid type for autosave"
         self.autosave: bool = conf["autosave"]
+        assert isinstance(conf["checkpoint_interval"], int) and conf["checkpoint_interval"] >= 0, \
+            "Invalid type for checkpoint_interval"
+        self.checkpoint_interval: int = conf["checkpoint_interval"]
+        assert isinstance(conf["headless"],
+                          bool), "Invalid type for headless"
+        self.headless: bool = conf["headless"]
+        assert isinstance(conf["workers"],
+                          int) and conf["workers"] >= 0, "Invalid type for workers"
+        self.workers: int = conf["workers"] or os.cpu_count()
+        assert conf["sensors"] in ["exact", "field"], "Invalid option for sensors"
+        self.sensors: str = conf["sensors"]
+        assert isinstance(conf["field_resolution"],
+                          int) and conf["field_resolution"] > 0, "Invalid type for field_resolution"
+        self.field_resolution: int = conf["field_resolution"]
+        for option in ("stall_time", "plateau_time", "max_generation_time"):
+            assert isinstance(conf[option], (int, float)) and conf[option] >= 0, \
+                "Invalid type for " + option
+        self.stall_time: float = conf["stall_time"]
+        self.plateau_time: float = conf["plateau_time"]
+        self.max_generation_time: float = conf["max_generation_time"]
+        assert conf["seed"] == "None" or isinstance(conf["seed"], int), "Invalid type for seed"
+        self.seed: Optional[int] = None if conf["seed"] == "None" else conf["seed"]
+        assert isinstance(conf["circuit_cache"], str), "Invalid type for circuit_cache"
+        self.circuit_cache: Optional[str] = None if conf["circuit_cache"] == "None" \
+            else conf["circuit_cache"]
+        assert isinstance(conf["circuits_number"],
+                          int) and conf["circuits_number"] > 0, "Invalid type for circuits_number"
+        self.circuits_number: int = conf["circuits_number"]
+        assert conf["fitness_aggregation"] in ["mean", "min", "quantile"
+                                               ], "Invalid option for fitness_aggregation"
+        self.fitness_aggregation: str = conf["fitness_aggregation"]
+        assert isinstance(conf["fitness_quantile"], (int, float)) and \
+            0 <= conf["fitness_quantile"] <= 1, "Invalid type for fitness_quantile"
+        self.fitness_quantile: float = conf["fitness_quantile"]
         self.treat_colors()
         self.calc_scale()
 
@@ -0,0 +1,211 @@
+"""
+Champ de distance précalculé du circuit
+
+Les bordures du circuit peuvent être rastérisées dès sa création dans une grille
+(:class:`DistanceField`) donnant, pour chaque case, la distance au mur le plus proche. Les capteurs des voitures sont alors calculés par lancer de sphères (sphere
+tracing) dans cette grille, et la proximité d'un mur par une simple lecture, sans aucun calcul
+d'intersection.
+
+Le résultat est une approximation, d'autant plus précise que la résolution est fine : il est
+possible de choisir pour chaque exécution entre ces capteurs et les capteurs exacts (voir l'option
+`sensors` de :class:`config_manager.Config`).
+"""
+
+from math import floor, inf
+from typing import Dict, List, Tuple
+import numpy as np
+from spatial_index import HALF_DIAGONAL, grid_geometry, point_segment_distances
+
+#: Résolution par défaut de la grille, en pixels par case
+DEFAULT_RESOLUTION = 4
+#: Nombre de points de la grille traités en une fois lors de la rastérisation
+_CHUNK_SIZE = 4096
+
+
+class DistanceField:
+    """Grille contenant la distance au mur le plus proche du centre de chaque case
+
+    La grille a la même emprise qu'une :class:`spatial_index.BorderGrid` (voir
+    :func:`spatial_index.grid_geometry`). En dehors de la grille, aucun mur n'est considéré.
+    """
+
+    def __init__(self, segments: np.ndarray, screen_size: Tuple[int, int],
+                 resolution: float = DEFAULT_RESOLUTION):
+        """Rastérise les segments du circuit
+
+        Parameters
+        ----------
+        segments:
+            Segments du circuit, de taille (S, 4) (voir :func:`classes.segments_array`)
+        screen_size: (:class:`int`, :class:`int`)
+            Taille de la fenêtre, en (x, y)
+        resolution:
+            Taille d'une case de la grille, en pixels [par défaut :data:`DEFAULT_RESOLUTION`]
+        """
+        segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+        self.resolution: float = resolution  #: Taille d'une case, en pixels
+        origin, width, height = grid_geometry(segments, screen_size, resolution)
+        self.origin: Tuple[float, float] = origin  #: Coin supérieur gauche de la grille
+        self.width: int = width  #: Nombre de colonnes
+        self.height: int = height  #: Nombre de lignes
+        #: Marge d'erreur de la grille : demi-diagonale d'une case
+        self.tolerance: float = resolution * HALF_DIAGONAL
+        #: Distance au mur le plus proche du centre de chaque case, de taille (height, width)
+        self.grid: np.ndarray = np.full((self.height, self.width), inf)
+        if len(segments) > 0:
+            self._rasterize(segments)
+        self._prepare()
+
+    def _prepare(self):
+        """Prépare les copies de la grille utilisées pour les lectures rapides"""
+        self._rows: List[List[float]] = self.grid.tolist()
+        # Grille entourée d'une case infinie, aplatie, pour lire sans tester les bords
+        self._padded: np.ndarray = np.pad(self.grid, 1, constant_values=inf).ravel()
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Exporte le champ sous forme de tableaux, pour l'enregistrer sur le disque (voir
+        :mod:`circuit_cache`)"""
+        return {
+            "grid": self.grid,
+            "geometry": np.array([self.origin[0], self.origin[1], self.resolution], dtype=float)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "DistanceField":
+        """Reconstruit un champ exporté par :meth:`to_arrays`, sans rastériser à nouveau le
+        circuit"""
+        field = cls.__new__(cls)
+        origin_x, origin_y, field.resolution = arrays["geometry"].tolist()
+        field.origin = (origin_x, origin_y)
+        field.grid = np.asarray(arrays["grid"], dtype=float)
+        field.height, field.width = field.grid.shape
+        field.tolerance = field.resolution * HALF_DIAGONAL
+        field._prepare()
+        return field
+
+    def _rasterize(self, segments: np.ndarray):
+        """Calcule la distance entre le centre de chaque case et le segment le plus proche"""
+        cols, rows = np.meshgrid(np.arange(self.width), np.arange(self.height))
+        centers = np.column_stack([self.origin[0] + (cols.ravel() + 0.5) * self.resolution,
+                                   self.origin[1] + (rows.ravel() + 0.5) * self.resolution])
+        flat = self.grid.reshape(-1)
+        for start in range(0, len(flat), _CHUNK_SIZE):
+            flat[start:start + _CHUNK_SIZE] = point_segment_distances(
+                centers[start:start + _CHUNK_SIZE], segments).min(axis=1)
+
+    def distance(self, x: float, y: float) -> float:
+        """Donne la distance approximative entre un point et le mur le plus proche
+
+        Returns
+        -------
+        :class:`float`:
+            Distance lue dans la case contenant le point, ou `inf` hors de la grille
+        """
+        col = floor((x - self.origin[0]) / self.resolution)
+        row = floor((y - self.origin[1]) / self.resolution)
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return self._rows[row][col]
+        return inf
+
+    def distances(self, points: np.ndarray) -> np.ndarray:
+        """Version vectorisée de :meth:`distance`
+
+        Parameters
+        ----------
+        points:
+            Points à tester, de taille (..., 2)
+
+        Returns
+        -------
+        :class:`numpy.ndarray`:
+            Distance approximative au mur le plus proche pour chaque point, `inf` hors de la grille
+        """
+        points = np.asarray(points, dtype=float)
+        cols = np.floor((points[..., 0] - self.origin[0]) / self.resolution).astype(np.intp)
+        rows = np.floor((points[..., 1] - self.origin[1]) / self.resolution).astype(np.intp)
+        inside = (cols >= 0) & (cols < self.width) & (rows >= 0) & (rows < self.height)
+        result = np.full(cols.shape, inf)
+        result[inside] = self.grid[rows[inside], cols[inside]]
+        return result
+
+    def ray_distance(self, x: float, y: float, dx: float, dy: float, max_distance: float) -> float:
+        """Cherche le mur le plus proche rencontré par un rayon, par lancer de sphères
+
+        Le rayon avance à chaque fois de la distance au mur le plus proche (moins la marge
+        d'erreur de la grille, avec un pas minimum d'une demi-case), jusqu'à arriver à moins de
+        :attr:`tolerance` d'un mur, dont la distance restante est alors ajoutée au résultat. Même
+        interface que :meth:`spatial_index.BorderGrid.ray_distance`.
+
+        Parameters
+        ----------
+        x, y:
+            Origine du rayon
+        dx, dy:
+            Direction du rayon, qui doit être un vecteur unitaire
+        max_distance:
+            Distance maximum à prendre en compte
+
+        Returns
+        -------
+        :class:`float`:
+            Distance approximative jusqu'au mur le plus proche, ou -1 si aucun mur n'est rencontré
+            avant `max_distance`
+        """
+        min_step = self.resolution / 2
+        t = 0
+        while t <= max_distance:
+            distance = self.distance(x + dx * t, y + dy * t)
+            if distance <= self.tolerance:
+                return min(t + distance, max_distance)
+            t += max(distance - self.tolerance, min_step)
+        return -1
+
+    def batch_ray_distances(self, positions: np.ndarray, rotations: np.ndarray, rays: List[int],
+                            max_distance: float) -> np.ndarray:
+        """Version vectorisée de :meth:`ray_distance` pour toute une population de voitures
+
+        Même interface que :func:`classes.batch_raytrace` : tous les rayons avancent ensemble,
+        jusqu'à ce qu'ils aient tous touché un mur ou dépassé `max_distance`.
+
+        Parameters
+        ----------
+        positions:
+            Positions des voitures, de taille (C, 2)
+        rotations:
+            Rotations absolues des voitures en degrés, de taille (C,)
+        rays:
+            Angles des rayons en degrés, relatifs à la voiture
+        max_distance:
+            Distance maximum à prendre en compte
+
+        Returns
+        -------
+        :class:`numpy.ndarray`:
+            Matrice de taille (C, R) des distances approximatives au mur le plus proche pour chaque
+            rayon, ou -1 si aucun mur n'est rencontré avant `max_distance`
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        rotations = np.asarray(rotations, dtype=float).reshape(-1)
+        angles = np.radians(rotations[:, None] + np.asarray(rays, dtype=float)[None, :]).ravel()
+        # Coordonnées exprimées en cases de la grille bordée (voir :attr:`_padded`)
+        x = np.repeat((positions[:, 0] - self.origin[0]) / self.resolution + 1, len(rays))
+        y = np.repeat((positions[:, 1] - self.origin[1]) / self.resolution + 1, len(rays))
+        dx = np.cos(angles) / self.resolution
+        dy = np.sin(angles) / self.resolution
+        result = np.full(len(angles), -1.0)
+        t = np.zeros(len(angles))
+        rays_id = np.arange(len(angles))  # rayons encore en cours
+        min_step = self.resolution / 2
+        stride = self.width + 2
+        while len(rays_id) > 0:
+            cols = np.clip(x + dx * t, 0, self.width + 1).astype(np.intp)
+            rows = np.clip(y + dy * t, 0, self.height + 1).astype(np.intp)
+            distance = self._padded[rows * stride + cols]
+            hit = distance <= self.tolerance
+            result[rays_id[hit]] = np.minimum(t[hit] + distance[hit], max_distance)
+            t += np.maximum(distance - self.tolerance, min_step)
+            keep = ~hit & (t <= max_distance)
+            if not keep.all():
+                x, y, dx, dy, t, rays_id = x[keep], y[keep], dx[keep], dy[keep], t[keep], \
+                    rays_id[keep]
+        return result.reshape(len(positions), len(rays))
@@ -120,6 +120,26 @@ def drawvec(screen: pygame.Surface, car: Car, angle: int, length: int, style: st
         pygame.draw.line(screen, car.color, c, d, 1)
 
 
+def rays(screen: pygame.Surface, cars: List[Car], style: str):
+    """Dessine les rayons du raytracing de plusieurs voitures
+
+    Les distances utilisées sont celles du cache de chaque voiture (voir :meth:`classes.Car.sense`)
+
+    Parameters
+    ----------
+    screen:
+        La fenêtre du programme
+    cars:
+        Liste des voitures dont les rayons doivent être dessinés
+    style:
+        Le style a utiliser (une croix au bout, ou un trait droit)
+    """
+    for car in cars:
+        for angle, length in zip(car.rays, car.distances):
+            if length != -1:
+                drawvec(screen, car, angle, length, style)
+
+
 def general_stats(screen: pygame.Surface, font: pygame.font, clock: pygame.time.Clock, gen_nbr: int,
                   cars_nbr: int, start_time: float):
     """Affiche les informations générales à l'écran
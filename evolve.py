@@ -6,58 +6,43 @@ combinaison de mutations et de mélanges pour créer une nouvelle génération d
 à partir des meilleurs de l'ancienne génération.
 """
 
-from classes import Car, Network
+from classes import Car, Network, genome_bounds
 from pygame import Color
-from copy import deepcopy as copy
-from typing import List
-import random
+from typing import List, Optional
+import numpy as np
 
 
-def mutation(networks: List[Network]) -> List[Network]:
+def mutation(networks: List[Network], rng: Optional[np.random.Generator] = None):
     """Génère une mutation sur un réseau neuronal
 
-    Chaque neurone a une faible probabilité de voir son poids modifié à une valeur aléatoire, entre
-    -2.0 et 4.0, ainsi que son bias, entre -1.0 et 1.0
+    Chaque paramètre du génome du réseau (voir :attr:`classes.Network.genome`) a une faible
+    probabilité d'être tiré à nouveau au hasard, entre -2.0 et 2.0 pour un poids et entre -1.0 et
+    1.0 pour une constante. Les paramètres à modifier sont choisis en une seule fois par un masque
+    aléatoire.
 
     Parameters
     ----------
     networks:
         Liste de réseaux neuronaux à modifier
+    rng:
+        Générateur aléatoire à utiliser [par défaut un nouveau générateur]
     """
+    if rng is None:
+        rng = np.random.default_rng()
     mutation_rate = 0.15
     for net in networks:
-        for neuron in net.I_layer:
-            if random.random() < mutation_rate:
-                neuron.bias = random.random()*2 - 1
-            for i in range(len(neuron.weight)):
-                if random.random() < mutation_rate:
-                    neuron.weight[i] = random.random()*4 - 2
-        for neuron in net.layer_2:
-            if random.random() < mutation_rate:
-                neuron.bias = random.random()*2 - 1
-            for i in range(len(neuron.weight)):
-                if random.random() < mutation_rate:
-                    neuron.weight[i] = random.random()*4 - 2
-        for neuron in net.layer_3:
-            if random.random() < mutation_rate:
-                neuron.bias = random.random()*2 - 1
-            for i in range(len(neuron.weight)):
-                if random.random() < mutation_rate:
-                    neuron.weight[i] = random.random()*4 - 2
-        for neuron in net.layer_4:
-            if random.random() < mutation_rate:
-                neuron.bias = random.random()*2 - 1
-            for i in range(len(neuron.weight)):
-                if random.random() < mutation_rate:
-                    neuron.weight[i] = random.random()*4 - 2
-
-
-def swap(n1: Network, n2: Network) -> [Network, Network]:
+        low, high = genome_bounds(tuple(net.sizes))
+        mask = rng.random(len(net.genome)) < mutation_rate
+        net.genome[mask] = rng.uniform(low[mask], high[mask])
+
+
+def swap(n1: Network, n2: Network,
+         rng: Optional[np.random.Generator] = None) -> [Network, Network]:
     """
     Mélange les composantes de deux réseaus neuronaux
 
-    Chaque neurone du réseau 1 a 60% de chance de se faire échanger avec le neurone correspondant
-    du réseau 2.
+    Chaque paramètre du génome du réseau 1 a 60% de chance de se faire échanger avec le paramètre
+    correspondant du réseau 2.
 
     Parameters
     ----------
@@ -65,72 +50,60 @@ def swap(n1: Network, n2: Network) -> [Network, Network]:
         Permier réseau neuronal
     n2:
         Second réseau neuronal
+    rng:
+        Générateur aléatoire à utiliser [par défaut un nouveau générateur]
 
     Returns
     -------
     [Network, Network]:
         Les deux réseaux une fois mélangés
     """
+    if rng is None:
+        rng = np.random.default_rng()
     swap_rate = 0.6
-    for i, neuron in enumerate(n1.I_layer):
-        if random.random() < swap_rate:
-            t = neuron.bias
-            neuron.bias = n2.I_layer[i].bias
-            n2.I_layer[i].bias = t
-        for j in range(len(neuron.weight)):
-            if random.random() < swap_rate:
-                n2.I_layer[i].weight[j], neuron.weight[j] = neuron.weight[j], n2.I_layer[i].weight[j]
-    for i, neuron in enumerate(n1.layer_2):
-        if random.random() < swap_rate:
-            t = neuron.bias
-            neuron.bias = n2.layer_2[i].bias
-            n2.layer_2[i].bias = t
-        for j in range(len(neuron.weight)):
-            if random.random() < swap_rate:
-                n2.layer_2[i].weight[j], neuron.weight[j] = neuron.weight[j], n2.layer_2[i].weight[j]
-    for i, neuron in enumerate(n1.layer_3):
-        if random.random() < swap_rate:
-            t = neuron.bias
-            neuron.bias = n2.layer_3[i].bias
-            n2.layer_3[i].bias = t
-        for j in range(len(neuron.weight)):
-            if random.random() < swap_rate:
-                n2.layer_3[i].weight[j], neuron.weight[j] = neuron.weight[j], n2.layer_3[i].weight[j]
-    for i, neuron in enumerate(n1.layer_4):
-        if random.random() < swap_rate:
-            t = neuron.bias
-            neuron.bias = n2.layer_4[i].bias
-            n2.layer_4[i].bias = t
-        for j in range(len(neuron.weight)):
-            if random.random() < swap_rate:
-                n2.layer_4[i].weight[j], neuron.weight[j] = neuron.weight[j], n2.layer_4[i].weight[j]
+    mask = rng.random(len(n1.genome)) < swap_rate
+    n1.genome[mask], n2.genome[mask] = n2.genome[mask], n1.genome[mask]
     return (n1, n2)
 
 
-def darwin(networks: List[Network]) -> List[Network]:
+def darwin(networks: List[Network],
+           rng: Optional[np.random.Generator] = None) -> List[Network]:
     """Applique le modèle d'évolution dite "de Darwin" à une population de réseaux neuronaux
 
     Les réseaux sont triés selon leurs scores, puis les meilleurs d'entre eux sont utilisés pour
     créer d'autres réseaux, remplaçant les moins bons. Enfin, la plus grande partie des réseaux
     subit un phénomène de mutation altérant de manière aléatoire certaines de leurs valeurs.
 
+    Les nouveaux réseaux sont des copies (voir :meth:`classes.Network.clone`) : les génomes des
+    réseaux donnés ne sont jamais modifiés, seules leurs voitures sont réutilisées.
+
+    Tous les tirages aléatoires utilisent le générateur donné : avec un générateur initialisé par
+    la même graine, l'évolution est toujours la même.
+
     Parameters
     ----------
     networks:
         Liste des réseaux neuronaux sur lesquels appliquer l'évolution
+    rng:
+        Générateur aléatoire à utiliser [par défaut un nouveau générateur]
 
     Returns
     -------
     List[Network]:
         Les réseaux unef fois édités
     """
+    if rng is None:
+        rng = np.random.default_rng()
     rank = sorted(networks, key=lambda net: net.score, reverse=True)  # first is best
-    new_gen = [copy(rank[0]), copy(rank[1])]
+    # Les voitures de l'ancienne génération sont réattribuées dans le même ordre, pour rester
+    # dans la même flotte
+    cars = iter([net.car for net in networks])
+    new_gen = [rank[0].clone(next(cars)), rank[1].clone(next(cars))]
     for _ in range(0, max(4, len(rank)-4), 2):
-        new_gen += swap(copy(rank[0]), copy(rank[1]))
+        new_gen += swap(rank[0].clone(next(cars, None)), rank[1].clone(next(cars, None)), rng)
     if len(new_gen) < len(rank):
-        new_gen += [Network(copy(networks[i].car)) for i in range(len(new_gen), len(rank))]
+        new_gen += [Network(next(cars), rng) for _ in range(len(new_gen), len(rank))]
     for x in new_gen:
         x.car.abs_rotation = 0
-    mutation(new_gen[2:])
+    mutation(new_gen[2:], rng)
     return new_gen[:len(networks)]
@@ -0,0 +1,477 @@
+"""
+Moteur de simulation sans affichage
+
+La classe :class:`Simulation` fait avancer toute une population de voitures avec un pas de temps
+fixe, sans aucune fenêtre pygame. L'interface graphique de :mod:`start` se contente d'observer son
+état entre deux étapes, ce qui permet aussi d'entraîner les réseaux sur une machine sans écran.
+
+Sans affichage, :class:`ParallelEvaluator` peut aussi répartir les réseaux d'une génération entre
+plusieurs processus, chacun simulant sa part de la population sur tous ses coeurs, et évaluer
+chaque réseau sur plusieurs circuits (voir :class:`FitnessAggregation`).
+"""
+
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple
+import numpy as np
+from classes import (Car, CarFleet, Network, Population, FINISH_DISTANCE, TICKS_PER_SECOND,
+                     segments_array)
+from spatial_index import point_segment_distances
+
+#: Nombre d'étapes sans aucune progression le long du circuit après lequel une voiture, bloquée ou
+#: tournant en rond, est éliminée par défaut
+STALL_TICKS = 2 * TICKS_PER_SECOND
+
+
+class TerminationPolicy:
+    """Règles d'arrêt d'une génération avant la mort de toutes les voitures
+
+    Chaque règle est exprimée en étapes de simulation, et désactivée si elle vaut 0 :
+
+    - une voiture dont la progression le long du circuit n'a pas augmenté depuis `stall_ticks`
+      étapes est éliminée ;
+    - la génération s'arrête si aucune voiture encore en vie n'a progressé le long du circuit
+      depuis `plateau_ticks` étapes : une voiture qui ne progresse pas ne fait que perdre des
+      points, elle ne peut donc plus ni dépasser une autre voiture ni atteindre l'arrivée ;
+    - la génération s'arrête dans tous les cas après `max_ticks` étapes.
+    """
+
+    def __init__(self, stall_ticks: int = STALL_TICKS, plateau_ticks: int = 0, max_ticks: int = 0):
+        """Initialise les règles d'arrêt
+
+        Parameters
+        ----------
+        stall_ticks:
+            Nombre d'étapes sans progression avant d'éliminer une voiture [par défaut
+            :data:`STALL_TICKS`]
+        plateau_ticks:
+            Nombre d'étapes sans progression d'aucune voiture avant d'arrêter la génération [par
+            défaut désactivé]
+        max_ticks:
+            Nombre maximal d'étapes d'une génération [par défaut désactivé]
+        """
+        self.stall_ticks: int = stall_ticks  #: Étapes sans progression avant élimination
+        self.plateau_ticks: int = plateau_ticks  #: Étapes sans progression de la population
+        self.max_ticks: int = max_ticks  #: Nombre maximal d'étapes d'une génération
+
+    @classmethod
+    def from_settings(cls, settings) -> 'TerminationPolicy':
+        """Crée les règles d'arrêt à partir de la configuration, exprimée en secondes de jeu
+
+        Parameters
+        ----------
+        settings: :class:`config_manager.Config`
+            Configuration du programme
+        """
+        return cls(round(settings.stall_time * TICKS_PER_SECOND),
+                   round(settings.plateau_time * TICKS_PER_SECOND),
+                   round(settings.max_generation_time * TICKS_PER_SECOND))
+
+
+class Simulation:
+    """Simulation d'une génération de réseaux neuronaux sur un circuit
+
+    Chaque appel à :meth:`step` fait avancer toutes les voitures encore en vie d'un pas de temps
+    fixe : raytracing groupé, détection des collisions, calcul des réseaux puis déplacement.
+    Aucune mesure du temps réel n'est utilisée : deux simulations des mêmes réseaux sur le même
+    circuit donnent exactement les mêmes scores.
+    """
+
+    def __init__(self, circuit: dict, networks: List[Network], car_maniability: float,
+                 speed: float, policy: Optional[TerminationPolicy] = None):
+        """Initialise la simulation
+
+        Parameters
+        ----------
+        circuit:
+            Dictionnaire du circuit, tel que retourné par :func:`circuit.circuit_creation`
+        networks:
+            Réseaux neuronaux à faire avancer, chacun avec sa voiture
+        car_maniability:
+            Nombre de degrés maximum de rotation par étape
+        speed:
+            Vitesse maximale des voitures, en pixels par étape
+        policy:
+            Règles d'arrêt de la génération [par défaut :class:`TerminationPolicy` par défaut]
+        """
+        self.circuit: dict = circuit  #: Circuit utilisé
+        self.networks: List[Network] = networks  #: Réseaux neuronaux de la génération
+        self.car_maniability: float = car_maniability  #: Rotation maximale par étape
+        self.speed: float = speed  #: Vitesse maximale par étape
+        self.steps: int = 0  #: Nombre d'étapes déjà effectuées, horloge de la génération
+        #: Population regroupant les réseaux, pour les calculer tous en une fois
+        self.population: Population = Population(networks)
+        #: Flotte contenant l'état de toutes les voitures
+        self.fleet: CarFleet = networks[0].car.fleet
+        assert all(net.car.fleet is self.fleet for net in networks
+                   ), "Toutes les voitures doivent appartenir à la même flotte"
+        #: Indice de la voiture de chaque réseau dans la flotte
+        self.slots: np.ndarray = np.array([net.car.slot for net in networks])
+        #: Règles d'arrêt de la génération
+        self.policy: TerminationPolicy = policy if policy is not None else TerminationPolicy()
+
+    @property
+    def alive(self) -> List[Network]:
+        """Liste des réseaux dont la voiture n'a pas encore touché de mur"""
+        return [self.networks[i] for i in np.flatnonzero(self.fleet.alive[self.slots])]
+
+    @property
+    def finished(self) -> bool:
+        """Indique si la génération est terminée : toutes les voitures sont mortes, ou l'une des
+        règles d'arrêt de :attr:`policy` est atteinte"""
+        policy, fleet = self.policy, self.fleet
+        if policy.max_ticks and self.steps >= policy.max_ticks:
+            return True
+        slots = self.slots[fleet.alive[self.slots]]
+        if policy.plateau_ticks and fleet.centerline is not None and len(slots) > 0 and \
+                (fleet.ticks[slots] - fleet.progress_ticks[slots] >= policy.plateau_ticks).all():
+            return True
+        return len(slots) == 0
+
+    def sense(self):
+        """Calcule en une seule fois le raytracing des voitures en vie qui n'en ont pas en cache
+
+        Cette méthode est appelée automatiquement par :meth:`step`, mais peut aussi être utilisée
+        par un observateur souhaitant afficher les rayons avant l'étape suivante.
+        """
+        fleet = self.fleet
+        fleet.sense(self.slots[fleet.alive[self.slots] & ~fleet.sensed[self.slots]])
+
+    def step(self) -> (np.ndarray, np.ndarray):
+        """Fait avancer toutes les voitures en vie d'une étape
+
+        Les voitures en collision avec un mur ou ayant atteint la ligne d'arrivée sont détectées en
+        une seule fois (voir :meth:`classes.CarFleet.collisions`) et marquées comme mortes, puis les
+        réseaux de toutes les autres sont calculés en une seule fois par la
+        :class:`classes.Population`, avant de tourner et déplacer toutes les voitures en une fois
+        avec :meth:`classes.CarFleet.move`. Enfin, les voitures dont la progression le long du
+        circuit n'a pas augmenté depuis trop longtemps sont éliminées (voir
+        :class:`TerminationPolicy`).
+
+        Returns
+        -------
+        (:class:`numpy.ndarray`, :class:`numpy.ndarray`):
+            Les masques booléens, dans l'ordre des réseaux, des voitures qui viennent de toucher un
+            mur et de celles qui viennent d'atteindre la ligne d'arrivée
+        """
+        self.sense()
+        fleet = self.fleet
+        alive = fleet.alive[self.slots]
+        crashed = np.zeros(len(self.slots), dtype=bool)
+        arrived = np.zeros(len(self.slots), dtype=bool)
+        if alive.any():
+            crashed[alive], arrived[alive] = fleet.collisions(self.slots[alive])
+            arrived &= ~crashed
+            fleet.alive[self.slots[crashed | arrived]] = False
+        alive = fleet.alive[self.slots]
+        if alive.any():
+            slots = self.slots[alive]
+            self.population.update(alive, fleet.sensors[slots], Car.rays_length)
+            crashed[alive] |= fleet.move(
+                slots, self.car_maniability * self.population.directions[alive],
+                self.population.engines[alive] * self.speed)
+        self.steps += 1
+        if fleet.centerline is not None and self.policy.stall_ticks:
+            slots = self.slots[fleet.alive[self.slots]]
+            stalled = fleet.ticks[slots] - fleet.progress_ticks[slots] > self.policy.stall_ticks
+            fleet.alive[slots[stalled]] = False
+        return crashed, arrived
+
+    def run(self):
+        """Fait avancer la simulation jusqu'à la mort de toutes les voitures"""
+        while not self.finished:
+            self.step()
+
+    def scores(self) -> np.ndarray:
+        """Calcule le score de chaque réseau à l'instant présent
+
+        Le score est celui de la voiture (voir :meth:`classes.Car.get_score`), avec un bonus si
+        elle a atteint la ligne d'arrivée.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`:
+            Score de chaque réseau, dans l'ordre de :attr:`networks`
+        """
+        arrival = segments_array([self.fleet.last_border])  # ligne d'arrivée
+        arrived = point_segment_distances(self.fleet.positions[self.slots], arrival)[:, 0]
+        # points bonus si la voiture a atteint la ligne d'arrivée
+        return self.fleet.scores(self.slots) + 300 * (arrived <= FINISH_DISTANCE)
+
+    def compute_scores(self):
+        """Enregistre le score de chaque réseau à l'instant présent (voir :meth:`scores`)"""
+        for net, score in zip(self.networks, self.scores().tolist()):
+            net.score = score
+
+
+class FitnessAggregation:
+    """Combinaison des scores obtenus par chaque réseau sur plusieurs circuits en un seul score
+
+    Trois méthodes sont disponibles :
+
+    - "mean" : moyenne des scores de tous les circuits ;
+    - "min" : plus mauvais score, pour favoriser les réseaux réguliers sur tous les circuits ;
+    - "quantile" : quantile `quantile` des scores, compromis entre les deux précédentes.
+    """
+
+    #: Méthodes de combinaison disponibles
+    METHODS = ("mean", "min", "quantile")
+
+    def __init__(self, method: str = "mean", quantile: float = 0.5):
+        """Initialise la méthode de combinaison
+
+        Parameters
+        ----------
+        method:
+            Méthode de combinaison, parmi :attr:`METHODS` [par défaut "mean"]
+        quantile:
+            Quantile à utiliser avec la méthode "quantile", entre 0 et 1 [par défaut la médiane]
+        """
+        assert method in self.METHODS, "Méthode de combinaison inconnue : " + method
+        self.method: str = method  #: Méthode de combinaison
+        self.quantile: float = quantile  #: Quantile utilisé par la méthode "quantile"
+
+    @classmethod
+    def from_settings(cls, settings) -> 'FitnessAggregation':
+        """Crée la méthode de combinaison à partir de la configuration
+
+        Parameters
+        ----------
+        settings: :class:`config_manager.Config`
+            Configuration du programme
+        """
+        return cls(settings.fitness_aggregation, settings.fitness_quantile)
+
+    def __call__(self, scores: np.ndarray) -> np.ndarray:
+        """Combine les scores de chaque réseau
+
+        Parameters
+        ----------
+        scores:
+            Matrice de taille (N, C) des scores de chaque réseau sur chaque circuit
+
+        Returns
+        -------
+        :class:`numpy.ndarray`:
+            Score entier de chaque réseau, de taille (N,)
+        """
+        if self.method == "min":
+            result = scores.min(axis=1)
+        elif self.method == "quantile":
+            result = np.quantile(scores, self.quantile, axis=1)
+        else:
+            result = scores.mean(axis=1)
+        return np.rint(result).astype(int)
+
+
+#: Données partagées par toutes les simulations d'un processus de calcul, envoyées une seule
+#: fois par :func:`_init_worker`
+_WORKER_STATE: dict = {}
+
+
+def _init_worker(circuits: List[dict], starting_poses: List[Tuple[tuple, float]],
+                 car_maniability: float, speed: float, policy: Optional[TerminationPolicy]):
+    """Initialise un processus de calcul de :class:`ParallelEvaluator`"""
+    # Seul le processus principal doit réagir à Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _WORKER_STATE.update(circuits=circuits, starting_poses=starting_poses,
+                         car_maniability=car_maniability, speed=speed, policy=policy)
+
+
+def _evaluate_shard(circuit_index: int, parameters: List[tuple],
+                    state: Optional[dict] = None) -> List[int]:
+    """Simule une partie de la population sur un circuit, dans un processus de calcul
+
+    Parameters
+    ----------
+    circuit_index:
+        Indice du circuit à utiliser
+    parameters:
+        Génome et valeurs de chaque réseau à simuler
+    state:
+        Données partagées des simulations [par défaut celles du processus de calcul]
+
+    Returns
+    -------
+    List[:class:`int`]:
+        Score final de chaque réseau, dans le même ordre
+    """
+    if state is None:
+        state = _WORKER_STATE
+    circuit = state["circuits"][circuit_index]
+    starting_pos, abs_rotation = state["starting_poses"][circuit_index]
+    fleet = CarFleet(circuit["bordures"], len(parameters), starting_pos, abs_rotation,
+                     circuit["index"], circuit["field"], circuit["centerline"])
+    networks = [Network.from_parameters(fleet.car(slot, None), genome, values)
+                for slot, (genome, values) in enumerate(parameters)]
+    simulation = Simulation(circuit, networks, state["car_maniability"], state["speed"],
+                            state["policy"])
+    simulation.run()
+    simulation.compute_scores()
+    return [net.score for net in networks]
+
+
+class ParallelEvaluator:
+    """Évalue des générations complètes sur un ou plusieurs circuits, éventuellement réparties
+    sur plusieurs processus
+
+    Chaque processus reçoit tous les circuits et leurs positions de départ une seule fois à sa
+    création, puis uniquement les génomes des réseaux qu'il doit simuler et l'indice du circuit
+    à utiliser. Avec un seul processus, les simulations ont lieu directement dans le processus
+    principal, qui partage les mêmes circuits.
+
+    Dans tous les cas, les simulations utilisent des copies des réseaux : leurs valeurs de départ
+    ne sont pas modifiées, et les scores ne dépendent pas du nombre de processus. Les scores
+    obtenus sur tous les circuits sont ensuite combinés selon :attr:`aggregation`.
+    """
+
+    def __init__(self, circuits: List[dict], starting_poses: List[Tuple[tuple, float]],
+                 car_maniability: float, speed: float, workers: int = 1,
+                 policy: Optional[TerminationPolicy] = None,
+                 aggregation: Optional[FitnessAggregation] = None):
+        """Démarre les processus de calcul
+
+        Parameters
+        ----------
+        circuits:
+            Dictionnaires des circuits, tels que retournés par :func:`circuit.circuit_creation`
+        starting_poses: List[((:class:`int`, :class:`int`), :class:`float`)]
+            Position et rotation de départ des voitures sur chaque circuit
+        car_maniability:
+            Nombre de degrés maximum de rotation par étape
+        speed:
+            Vitesse maximale des voitures, en pixels par étape
+        workers:
+            Nombre de processus de calcul [par défaut 1]
+        policy:
+            Règles d'arrêt de chaque génération [par défaut :class:`TerminationPolicy` par défaut]
+        aggregation:
+            Combinaison des scores des différents circuits [par défaut leur moyenne]
+        """
+        assert len(circuits) == len(starting_poses) > 0, \
+            "Chaque circuit doit avoir une position de départ"
+        self.circuits: List[dict] = circuits  #: Circuits utilisés
+        self.car_maniability: float = car_maniability  #: Rotation maximale par étape
+        self.speed: float = speed  #: Vitesse maximale par étape
+        self.workers: int = workers  #: Nombre de processus de calcul
+        self.policy: Optional[TerminationPolicy] = policy  #: Règles d'arrêt des générations
+        #: Combinaison des scores des différents circuits
+        self.aggregation: FitnessAggregation = aggregation if aggregation is not None \
+            else FitnessAggregation()
+        # Données partagées des simulations faites dans le processus principal
+        self._state: dict = dict(circuits=circuits, starting_poses=starting_poses,
+                                 car_maniability=car_maniability, speed=speed, policy=policy)
+        self.pool: Optional[ProcessPoolExecutor] = None  #: Processus de calcul, si plusieurs
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(
+                circuits, starting_poses, car_maniability, speed, policy))
+
+    def evaluate(self, networks: List[Network]):
+        """Simule une génération complète sur chaque circuit et enregistre le score combiné de
+        chaque réseau
+
+        Parameters
+        ----------
+        networks:
+            Réseaux neuronaux de la génération
+        """
+        self._assign(networks, self._simulate(self._parameters(networks),
+                                              range(len(self.circuits))))
+
+    def submit_extra(self, networks: List[Network]) -> Callable[[], np.ndarray]:
+        """Lance la simulation d'une génération sur tous les circuits sauf le premier, par exemple
+        pendant que celui-ci est simulé avec affichage
+
+        Avec plusieurs processus de calcul, les simulations sont envoyées immédiatement et se
+        déroulent en parallèle du processus principal. Avec un seul, elles n'ont lieu qu'à la
+        demande des résultats, dans le processus principal.
+
+        Les scores ne sont pas enregistrés : ils doivent ensuite être combinés avec ceux du
+        premier circuit par :meth:`combine`.
+
+        Parameters
+        ----------
+        networks:
+            Réseaux neuronaux de la génération, avant toute simulation
+
+        Returns
+        -------
+        Callable[[], :class:`numpy.ndarray`]:
+            Fonction attendant la fin des simulations, et donnant la matrice de taille (N, C-1)
+            des scores de chaque réseau sur chaque circuit
+        """
+        return self._submit(self._parameters(networks), range(1, len(self.circuits)))
+
+    def combine(self, networks: List[Network], extra_scores: np.ndarray):
+        """Combine le score actuel de chaque réseau, obtenu sur le premier circuit, avec ceux
+        obtenus sur les autres circuits par :meth:`submit_extra`, et l'enregistre
+
+        Parameters
+        ----------
+        networks:
+            Réseaux neuronaux de la génération, dont les scores sont déjà calculés
+        extra_scores:
+            Scores de chaque réseau sur les autres circuits
+        """
+        self._assign(networks, np.column_stack([[net.score for net in networks], extra_scores]))
+
+    @staticmethod
+    def _parameters(networks: List[Network]) -> List[tuple]:
+        """Copie le génome et les valeurs de départ de chaque réseau, à envoyer aux simulations"""
+        return [(net.genome, [v.copy() for v in net.values]) for net in networks]
+
+    def _assign(self, networks: List[Network], scores: np.ndarray):
+        """Enregistre le score combiné de chaque réseau, à partir de ses scores sur chaque
+        circuit"""
+        for net, score in zip(networks, self.aggregation(scores).tolist()):
+            net.score = score
+
+    def _simulate(self, parameters: List[tuple], circuits: range) -> np.ndarray:
+        """Simule les réseaux sur plusieurs circuits, répartis entre les processus de calcul
+
+        Returns
+        -------
+        :class:`numpy.ndarray`:
+            Matrice de taille (N, len(circuits)) des scores de chaque réseau sur chaque circuit
+        """
+        return self._submit(parameters, circuits)()
+
+    def _submit(self, parameters: List[tuple], circuits: range) -> Callable[[], np.ndarray]:
+        """Envoie les simulations de :meth:`_simulate` aux processus de calcul, sans attendre leurs
+        résultats
+
+        Returns
+        -------
+        Callable[[], :class:`numpy.ndarray`]:
+            Fonction attendant la fin des simulations, et donnant la matrice des scores
+        """
+        scores = np.zeros((len(parameters), len(circuits)))
+        if self.pool is None:
+            def collect() -> np.ndarray:
+                for column, index in enumerate(circuits):
+                    scores[:, column] = _evaluate_shard(index, parameters, self._state)
+                return scores
+            return collect
+        shards = [range(i, len(parameters), self.workers) for i in range(self.workers)]
+        shards = [shard for shard in shards if len(shard) > 0]
+        tasks = [(column, index, shard) for column, index in enumerate(circuits)
+                 for shard in shards]
+        futures = [self.pool.submit(_evaluate_shard, index, [parameters[i] for i in shard])
+                   for _, index, shard in tasks]
+
+        def collect() -> np.ndarray:
+            for (column, _, shard), future in zip(tasks, futures):
+                scores[list(shard), column] = future.result()
+            return scores
+        return collect
+
+    def close(self):
+        """Arrête les processus de calcul"""
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,345 @@
+"""
+Index spatial des bordures du circuit
+
+Le circuit étant statique pendant toute l'exécution, ses bordures sont réparties une seule fois dans
+une grille uniforme (:class:`BorderGrid`). Un rayon ne teste alors que les bordures des cases qu'il
+traverse, et le coût du raytracing dépend de la densité locale de murs et non plus de la longueur
+totale du circuit.
+"""
+
+from math import ceil, floor, hypot, inf
+from typing import Dict, List, Tuple
+import numpy as np
+
+#: Taille par défaut d'une case de la grille, en pixels
+DEFAULT_CELL_SIZE = 40
+#: Demi-diagonale d'une case carrée de côté 1, arrondie par excès : distance maximale entre le
+#: centre d'une case et n'importe lequel de ses points
+HALF_DIAGONAL = 0.7072
+
+
+def ray_segment_distance(x: float, y: float, dx: float, dy: float,
+                         segment: Tuple[float, float, float, float]) -> float:
+    """Calcule la distance entre l'origine d'un rayon et son intersection avec un segment
+
+    Même calcul que :func:`classes.line_ray_intersection_point`, sans passer par des vecteurs
+    pygame.
+
+    Parameters
+    ----------
+    x, y:
+        Origine du rayon
+    dx, dy:
+        Direction du rayon, qui doit être un vecteur unitaire
+    segment:
+        Segment à tester, sous la forme (xA, yA, xB, yB)
+
+    Returns
+    -------
+    :class:`float`:
+        Distance jusqu'au point d'intersection, ou `inf` si le rayon ne touche pas le segment
+    """
+    ax, ay, bx, by = segment
+    v2_x, v2_y = bx - ax, by - ay
+    denom = v2_y * dx - v2_x * dy
+    if denom == 0:
+        return inf
+    v1_x, v1_y = x - ax, y - ay
+    t1 = (v2_x * v1_y - v2_y * v1_x) / denom
+    if t1 < 0:
+        return inf
+    t2 = (v1_y * dx - v1_x * dy) / denom
+    if 0 <= t2 <= 1:
+        return t1
+    return inf
+
+
+def point_segment_projections(points: np.ndarray,
+                              segments: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Projette en une seule fois des points sur des segments
+
+    Parameters
+    ----------
+    points:
+        Points à projeter, de taille (N, 2)
+    segments:
+        Segments à tester, soit communs à tous les points, de taille (S, 4), soit propres à chaque
+        point, de taille (N, S, 4) (voir :func:`classes.segments_array`)
+
+    Returns
+    -------
+    (:class:`numpy.ndarray`, :class:`numpy.ndarray`):
+        Matrices de taille (N, S) de la position du projeté de chaque point sur chaque segment,
+        entre 0 (début du segment) et 1 (fin du segment), et de la distance entre chaque point et
+        ce projeté
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    segments = np.asarray(segments, dtype=float)
+    if segments.ndim == 2:
+        segments = segments[None, :, :]
+    p_x, p_y = points[:, 0, None], points[:, 1, None]
+    a_x, a_y = segments[:, :, 0], segments[:, :, 1]
+    d_x, d_y = segments[:, :, 2] - a_x, segments[:, :, 3] - a_y
+    length2 = d_x * d_x + d_y * d_y
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = ((p_x - a_x) * d_x + (p_y - a_y) * d_y) / length2
+    t = np.clip(np.nan_to_num(t), 0, 1)
+    return t, np.hypot(a_x + t * d_x - p_x, a_y + t * d_y - p_y)
+
+
+def point_segment_distances(points: np.ndarray, segments: np.ndarray) -> np.ndarray:
+    """Calcule en une seule fois la distance entre des points et des segments
+
+    Parameters
+    ----------
+    points:
+        Points à tester, de taille (N, 2)
+    segments:
+        Segments à tester, soit communs à tous les points, de taille (S, 4), soit propres à chaque
+        point, de taille (N, S, 4) (voir :func:`classes.segments_array`)
+
+    Returns
+    -------
+    :class:`numpy.ndarray`:
+        Matrice de taille (N, S) de la distance entre chaque point et le point le plus proche de
+        chaque segment
+    """
+    return point_segment_projections(points, segments)[1]
+
+
+def grid_geometry(segments: np.ndarray, screen_size: Tuple[int, int],
+                  cell_size: float) -> ((float, float), int, int):
+    """Calcule l'emprise d'une grille couvrant la fenêtre ainsi que tous les segments qui en
+    dépasseraient
+
+    Parameters
+    ----------
+    segments:
+        Segments du circuit, de taille (S, 4) (voir :func:`classes.segments_array`)
+    screen_size: (:class:`int`, :class:`int`)
+        Taille de la fenêtre, en (x, y)
+    cell_size:
+        Taille d'une case de la grille, en pixels
+
+    Returns
+    -------
+    ((:class:`float`, :class:`float`), :class:`int`, :class:`int`):
+        Coin supérieur gauche de la grille, puis nombre de colonnes et de lignes
+    """
+    min_x, min_y, max_x, max_y = 0, 0, screen_size[0], screen_size[1]
+    if len(segments) > 0:
+        min_x = min(min_x, segments[:, [0, 2]].min())
+        min_y = min(min_y, segments[:, [1, 3]].min())
+        max_x = max(max_x, segments[:, [0, 2]].max())
+        max_y = max(max_y, segments[:, [1, 3]].max())
+    width = max(1, ceil((max_x - min_x) / cell_size))
+    height = max(1, ceil((max_y - min_y) / cell_size))
+    return (min_x, min_y), width, height
+
+
+def prefix_arrays(prefix: str, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Ajoute un préfixe au nom de chaque tableau, pour enregistrer plusieurs objets exportés par
+    `to_arrays` dans un même fichier (voir :meth:`BorderGrid.to_arrays`)"""
+    return {prefix + key: value for key, value in arrays.items()}
+
+
+def unprefix_arrays(prefix: str, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Extrait les tableaux dont le nom commence par un préfixe, sans ce préfixe (inverse de
+    :func:`prefix_arrays`)"""
+    return {key[len(prefix):]: arrays[key] for key in arrays if key.startswith(prefix)}
+
+
+class BorderGrid:
+    """Grille uniforme répartissant les bordures du circuit dans des cases carrées
+
+    La grille couvre la fenêtre ainsi que toutes les bordures qui en dépasseraient (voir
+    :func:`grid_geometry`). Chaque bordure est enregistrée dans toutes les cases qu'elle traverse.
+    """
+
+    def __init__(self, segments: np.ndarray, screen_size: Tuple[int, int],
+                 cell_size: float = DEFAULT_CELL_SIZE):
+        """Construit la grille à partir des segments du circuit
+
+        Parameters
+        ----------
+        segments:
+            Segments du circuit, de taille (S, 4) (voir :func:`classes.segments_array`)
+        screen_size: (:class:`int`, :class:`int`)
+            Taille de la fenêtre, en (x, y)
+        cell_size:
+            Taille d'une case de la grille, en pixels [par défaut :data:`DEFAULT_CELL_SIZE`]
+        """
+        self.segments: np.ndarray = np.asarray(segments, dtype=float).reshape(-1, 4)
+        self.cell_size: float = cell_size  #: Taille d'une case, en pixels
+        origin, width, height = grid_geometry(self.segments, screen_size, cell_size)
+        self.origin: Tuple[float, float] = origin  #: Coin supérieur gauche de la grille
+        self.width: int = width  #: Nombre de colonnes
+        self.height: int = height  #: Nombre de lignes
+        #: Indices des segments présents dans chaque case, case par case
+        self.cells: List[List[int]] = [[] for _ in range(self.width * self.height)]
+        for index, segment in enumerate(self.segments):
+            for cell in self._segment_cells(segment):
+                self.cells[cell].append(index)
+        # Version rectangulaire des cases, complétée par des -1, pour les requêtes vectorisées.
+        # La dernière ligne est toujours vide et sert aux cases hors de la grille
+        depth = max([len(c) for c in self.cells] + [1])
+        self.table: np.ndarray = np.full((len(self.cells) + 1, depth), -1, dtype=np.intp)
+        for cell, content in enumerate(self.cells):
+            self.table[cell, :len(content)] = content
+        self._segments_list: List[Tuple[float, float, float, float]] = [
+            tuple(s) for s in self.segments.tolist()]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Exporte la grille sous forme de tableaux, pour l'enregistrer sur le disque (voir
+        :mod:`circuit_cache`)"""
+        return {
+            "segments": self.segments,
+            "table": self.table,
+            "geometry": np.array([self.origin[0], self.origin[1], self.cell_size,
+                                  self.width, self.height], dtype=float)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "BorderGrid":
+        """Reconstruit une grille exportée par :meth:`to_arrays`, sans recalculer ses cases"""
+        grid = cls.__new__(cls)
+        grid.segments = np.asarray(arrays["segments"], dtype=float).reshape(-1, 4)
+        origin_x, origin_y, grid.cell_size, width, height = arrays["geometry"].tolist()
+        grid.origin = (origin_x, origin_y)
+        grid.width, grid.height = int(width), int(height)
+        grid.table = np.asarray(arrays["table"], dtype=np.intp)
+        grid.cells = [[index for index in row if index >= 0]
+                      for row in grid.table[:-1].tolist()]
+        grid._segments_list = [tuple(s) for s in grid.segments.tolist()]
+        return grid
+
+    def _cell_coords(self, x: float, y: float) -> Tuple[int, int]:
+        """Donne la colonne et la ligne de la case contenant un point"""
+        return (floor((x - self.origin[0]) / self.cell_size),
+                floor((y - self.origin[1]) / self.cell_size))
+
+    def _segment_cells(self, segment: np.ndarray) -> List[int]:
+        """Liste les cases traversées par un segment
+
+        On parcourt les cases de la boîte englobante du segment, et on ne garde que celles dont le
+        centre est suffisamment proche du segment pour que celui-ci puisse les traverser.
+        """
+        ax, ay, bx, by = segment
+        col1, row1 = self._cell_coords(min(ax, bx), min(ay, by))
+        col2, row2 = self._cell_coords(max(ax, bx), max(ay, by))
+        col1, col2 = max(col1, 0), min(col2, self.width - 1)
+        row1, row2 = max(row1, 0), min(row2, self.height - 1)
+        half_diagonal = self.cell_size * HALF_DIAGONAL
+        length2 = (bx - ax) ** 2 + (by - ay) ** 2
+        result = []
+        for row in range(row1, row2 + 1):
+            for col in range(col1, col2 + 1):
+                cx = self.origin[0] + (col + 0.5) * self.cell_size
+                cy = self.origin[1] + (row + 0.5) * self.cell_size
+                if length2 == 0:
+                    t = 0
+                else:
+                    t = max(0, min(1, ((cx - ax) * (bx - ax) + (cy - ay) * (by - ay)) / length2))
+                if hypot(ax + t * (bx - ax) - cx, ay + t * (by - ay) - cy) <= half_diagonal:
+                    result.append(row * self.width + col)
+        return result
+
+    def ray_distance(self, x: float, y: float, dx: float, dy: float, max_distance: float) -> float:
+        """Cherche le mur le plus proche rencontré par un rayon
+
+        Les cases sont parcourues dans l'ordre où le rayon les traverse (algorithme
+        d'Amanatides-Woo), et le parcours s'arrête dès qu'un mur est trouvé avant la sortie de la
+        case courante, ou que `max_distance` est dépassée.
+
+        Parameters
+        ----------
+        x, y:
+            Origine du rayon
+        dx, dy:
+            Direction du rayon, qui doit être un vecteur unitaire
+        max_distance:
+            Distance maximum à prendre en compte
+
+        Returns
+        -------
+        :class:`float`:
+            Distance réelle jusqu'au mur le plus proche, ou -1 si aucun mur n'est rencontré avant
+            `max_distance`
+        """
+        col, row = self._cell_coords(x, y)
+        if not (0 <= col < self.width and 0 <= row < self.height):
+            # Origine hors de la grille : on teste toutes les bordures
+            best = min([ray_segment_distance(x, y, dx, dy, s) for s in self._segments_list]
+                       + [inf])
+            return best if best <= max_distance else -1
+        step_col = 1 if dx > 0 else -1
+        step_row = 1 if dy > 0 else -1
+        grid_x = (x - self.origin[0]) / self.cell_size
+        grid_y = (y - self.origin[1]) / self.cell_size
+        if dx != 0:
+            t_max_x = (col + (dx > 0) - grid_x) * self.cell_size / dx
+            t_delta_x = self.cell_size / abs(dx)
+        else:
+            t_max_x = t_delta_x = inf
+        if dy != 0:
+            t_max_y = (row + (dy > 0) - grid_y) * self.cell_size / dy
+            t_delta_y = self.cell_size / abs(dy)
+        else:
+            t_max_y = t_delta_y = inf
+        best = inf
+        seen = set()
+        while True:
+            for index in self.cells[row * self.width + col]:
+                if index in seen:
+                    continue
+                seen.add(index)
+                distance = ray_segment_distance(x, y, dx, dy, self._segments_list[index])
+                if distance < best:
+                    best = distance
+            t_exit = min(t_max_x, t_max_y)
+            if best <= t_exit or t_exit > max_distance:
+                break
+            if t_max_x < t_max_y:
+                col += step_col
+                t_max_x += t_delta_x
+            else:
+                row += step_row
+                t_max_y += t_delta_y
+            if not (0 <= col < self.width and 0 <= row < self.height):
+                break
+        return best if best <= max_distance else -1
+
+    def candidates(self, positions: np.ndarray, radius: float) -> np.ndarray:
+        """Liste, pour chaque position, les segments susceptibles d'être à moins de `radius`
+
+        Toutes les cases touchant le carré de côté 2*`radius` centré sur chaque position sont
+        regroupées, de manière entièrement vectorisée.
+
+        Parameters
+        ----------
+        positions:
+            Positions à tester, de taille (C, 2)
+        radius:
+            Rayon de recherche
+
+        Returns
+        -------
+        :class:`numpy.ndarray`:
+            Tableau d'indices de segments de taille (C, K), sans doublons et complété par des -1
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        span = ceil(2 * radius / self.cell_size) + 1
+        low_col = np.floor((positions[:, 0] - radius - self.origin[0]) / self.cell_size)
+        low_row = np.floor((positions[:, 1] - radius - self.origin[1]) / self.cell_size)
+        cols = low_col.astype(np.intp)[:, None] + np.arange(span)  # (C, span)
+        rows = low_row.astype(np.intp)[:, None] + np.arange(span)
+        cells = rows[:, :, None] * self.width + cols[:, None, :]  # (C, span, span)
+        outside = ((cols < 0) | (cols >= self.width))[:, None, :] \
+            | ((rows < 0) | (rows >= self.height))[:, :, None]
+        cells[outside] = len(self.table) - 1
+        result = np.sort(self.table[cells].reshape(len(positions), -1), axis=1)
+        # Suppression des doublons, puis des colonnes ne contenant plus que des -1
+        result[:, 1:][result[:, 1:] == result[:, :-1]] = -1
+        result = -np.sort(-result, axis=1)
+        width = max(1, int((result >= 0).sum(axis=1).max(initial=0)))
+        return result[:, :width]
@@ -7,25 +7,31 @@ automatiquement.
 Utilisation : `python start.py`
 """
 
+import copy
 import time
 import cProfile
 import pstats
 import io
 import typing
-import copy
 from pstats import SortKey
 from math import ceil
+from contextlib import nullcontext
 import pygame
+import numpy as np
 import draw
-from circuit import circuit_creation
-from classes import Car, Border, Network
+from circuit import circuit_creation, random_generators
+from circuit_cache import CircuitCache
+from classes import Car, CarFleet, Border, Network
 from config_manager import Config, load_from_filename
 from evolve import darwin
 from backup_manager import BackupManager
+from simulation import Simulation, ParallelEvaluator, TerminationPolicy, FitnessAggregation
 
 
 Vector = pygame.math.Vector2
 SETTINGS: Config = None
+#: Nom des sauvegardes périodiques de la population (voir :func:`end_generation`)
+CHECKPOINT_NAME = "checkpoint"
 FPS = 20  # Sert à approximativement limiter les fps, sans avoir beaucoup d'impact sur les fps réels
 
 
@@ -56,6 +62,64 @@ def calc_starting_pos(point_a, point_b) -> ((int, int), float):
     return new_point, new_angle
 
 
+def create_circuits(circuit: dict) -> typing.List[dict]:
+    """
+    Crée la série de circuits sur lesquels les réseaux sont évalués, selon l'option
+    `circuits_number` de la configuration
+
+    Si une graine est fixée, les circuits supplémentaires utilisent les graines suivantes, et
+    sont générés en parallèle puis enregistrés dans le cache des circuits s'il est activé.
+
+    Parameters
+    ----------
+    circuit:
+        Le dictionnaire du circuit principal, qui sera le premier de la série
+
+    Returns
+    -------
+    List[dict]:
+        Les dictionnaires de tous les circuits, en commençant par le circuit principal
+    """
+    extra = SETTINGS.circuits_number - 1
+    if extra == 0:
+        return [circuit]
+    if SETTINGS.seed is None:
+        seeds = [int(seed) for seed in np.random.SeedSequence().generate_state(extra)]
+    else:
+        seeds = list(range(SETTINGS.seed + 1, SETTINGS.seed + 1 + extra))
+    if SETTINGS.seed is None or SETTINGS.circuit_cache is None:
+        circuits = []
+        for seed in seeds:
+            settings = copy.copy(SETTINGS)
+            settings.seed = seed
+            circuits.append(circuit_creation(settings))
+        return [circuit] + circuits
+    cache = CircuitCache(SETTINGS.circuit_cache)
+    keys = dict(cache.generate(SETTINGS, seeds, SETTINGS.workers))
+    return [circuit] + [cache.load(keys[seed], SETTINGS) for seed in seeds]
+
+
+def new_evaluator(circuits: typing.List[dict]) -> ParallelEvaluator:
+    """
+    Crée l'évaluateur des générations selon la configuration
+
+    Parameters
+    ----------
+    circuits:
+        Les dictionnaires des circuits utilisés, en commençant par le circuit principal
+
+    Returns
+    -------
+    ParallelEvaluator:
+        L'évaluateur, dont les processus de calcul sont démarrés
+    """
+    starting_poses = [calc_starting_pos(c["point1"], c["point2"]) for c in circuits]
+    return ParallelEvaluator(circuits, starting_poses, SETTINGS.car_maniability,
+                             2 * SETTINGS.scale_avg, SETTINGS.workers,
+                             TerminationPolicy.from_settings(SETTINGS),
+                             FitnessAggregation.from_settings(SETTINGS))
+
+
 def check_events() -> int:
     """Vérifie les touches entrées par l'utilisateur
 
@@ -96,7 +160,8 @@ def manual_loop(screen: pygame.Surface, circuit: typing.List[Border]):
     init_pos, init_angle = calc_starting_pos(
         circuit["point1"], circuit["point2"])
     car = Car(circuit["bordures"], color=color,
-              starting_pos=init_pos, abs_rotation=init_angle)
+              starting_pos=init_pos, abs_rotation=init_angle, index=circuit["index"],
+              field=circuit["field"])
     running = True
     start_time = time.time()
 
@@ -120,14 +185,14 @@ def manual_loop(screen: pygame.Surface, circuit: typing.List[Border]):
                 car.abs_rotation -= SETTINGS.car_maniability * delta
             if pressed[SETTINGS.right_key]:
                 car.abs_rotation += SETTINGS.car_maniability * delta
-            car.apply_vector(car.direction_vector())
+            moved = car.apply_vector(car.direction_vector())
 
             if min(car.position) < 0:
                 car.set_position(max(car.position[0], 0), max(car.position[1], 0))
             if max(car.position) > screen_width:
                 car.set_position(min(car.position[0], screen_width), min(
                     car.position[1], screen_width))
-            if not car.detection(screen, SETTINGS.display_rays):
+            if not moved or not car.detection(screen, SETTINGS.display_rays):
                 running = False
                 print("Votre voiture a touché un mur - fin de la partie")
 
@@ -145,7 +210,164 @@ def manual_loop(screen: pygame.Surface, circuit: typing.List[Border]):
         time.sleep(0.05)
 
 
-def AI_loop(screen: pygame.Surface, circuit: dict) -> Network:
+def init_networks(circuit: dict, rng: np.random.Generator) -> typing.List[Network]:
+    """
+    Crée la première génération de réseaux neuronaux, chacun avec sa voiture
+
+    Le premier réseau est chargé depuis la dernière sauvegarde si elle existe, binaire de
+    préférence (voir :mod:`backup_manager`).
+
+    Parameters
+    ----------
+    circuit:
+        Un dictionnaire contenant la liste des bordures représentant le circuit, ainsi que les deux
+        points définissant la ligne de départ
+    rng:
+        Le générateur aléatoire utilisé pour tirer les génomes
+
+    Returns
+    -------
+    List[Network]:
+        Les réseaux neuronaux créés
+    """
+    init_pos, init_angle = calc_starting_pos(
+        circuit["point1"], circuit["point2"])
+    fleet = CarFleet(circuit["bordures"], SETTINGS.cars_number, starting_pos=init_pos,
+                     abs_rotation=init_angle, index=circuit["index"], field=circuit["field"],
+                     centerline=circuit["centerline"])
+    networks = [Network(fleet.car(i, SETTINGS.colors["cars"]), rng) for i in range(len(fleet))]
+    # La sauvegarde binaire est projetée en mémoire : seul le premier réseau est lu
+    checkpoint = BackupManager().load_checkpoint(mmap=True)
+    if checkpoint is not None:
+        checkpoint.apply(networks[0])
+    else:
+        data = BackupManager().load()
+        if data["networks"]:
+            # Ancienne sauvegarde d'une population entière
+            for net, saved in zip(networks, data["networks"]):
+                net.from_json(saved)
+        else:
+            networks[0].from_json(data["network"])
+    networks[0].car.color = "#00FF00"
+    return networks
+
+
+def resume_networks(networks: typing.List[Network], backup: BackupManager,
+                    rng: np.random.Generator) -> (int, typing.List[dict]):
+    """
+    Reprend la population enregistrée par la dernière sauvegarde périodique, si elle existe et
+    que les sauvegardes périodiques sont activées
+
+    L'état du générateur aléatoire est aussi restauré : avec une graine fixée, l'entraînement
+    repris se déroule exactement comme s'il n'avait jamais été interrompu.
+
+    Parameters
+    ----------
+    networks:
+        Les réseaux neuronaux de la première génération, remplacés par ceux de la sauvegarde
+    backup:
+        Le gestionnaire des sauvegardes périodiques
+    rng:
+        Le générateur aléatoire utilisé par l'évolution, remis dans son état de la sauvegarde
+
+    Returns
+    -------
+    (int, List[dict]):
+        Le nombre de générations déjà terminées lors de la sauvegarde (0 si aucune n'existe), et
+        l'historique des scores de ces générations (voir :func:`end_generation`)
+    """
+    if not SETTINGS.checkpoint_interval:
+        return 0, []
+    checkpoint = backup.load_checkpoint()
+    if checkpoint is None or "generation" not in checkpoint.metadata:
+        return 0, []
+    checkpoint.restore(networks)
+    if "rng" in checkpoint.metadata:
+        rng.bit_generator.state = checkpoint.metadata["rng"]
+    print(f"Reprise de la population après la génération N°{checkpoint.metadata['generation']}")
+    return checkpoint.metadata["generation"], checkpoint.metadata.get("history", [])
+
+
+def end_generation(networks: typing.List[Network], increment: int,
+                   rng: np.random.Generator, backup: typing.Optional[BackupManager] = None,
+                   history: typing.Optional[typing.List[dict]] = None
+                   ) -> (typing.List[Network], typing.List[Network]):
+    """
+    Affiche le bilan d'une génération terminée puis crée la suivante
+
+    Toutes les `checkpoint_interval` générations, la nouvelle génération est enregistrée en
+    arrière-plan avec le numéro de la génération terminée, l'historique des scores et l'état du
+    générateur aléatoire, pour pouvoir reprendre l'entraînement après un arrêt (voir
+    :func:`resume_networks`).
+
+    Parameters
+    ----------
+    networks:
+        Les réseaux neuronaux de la génération terminée, dont les scores sont déjà calculés
+    increment:
+        Le numéro de la génération terminée
+    rng:
+        Le générateur aléatoire utilisé par l'évolution
+    backup:
+        Le gestionnaire des sauvegardes périodiques [par défaut aucune sauvegarde]
+    history:
+        L'historique des scores des générations précédentes, complété par celle-ci : une entrée
+        par génération, avec son numéro, son score moyen et son meilleur score [par défaut aucun
+        historique]
+
+    Returns
+    -------
+    (List[Network], List[Network]):
+        Les réseaux de la nouvelle génération, et ceux de la génération terminée
+    """
+    average = round(sum([net.score for net in networks])/len(networks))
+    print(f"Génération N°{increment} terminée - score moyen : {average}")
+    if history is not None:
+        history.append({"generation": increment, "average": int(average),
+                        "best": int(max(net.score for net in networks))})
+    # darwin ne modifie pas les génomes qu'on lui donne : inutile de les copier
+    last_networks = list(networks)
+
+    # Darwin
+    networks = darwin(networks, rng)
+
+    # Reset des réseaux/voitures
+    for net in networks:
+        net.car.color = SETTINGS.colors["cars"]
+    networks[0].car.fleet.reset()
+    networks[0].car.color = SETTINGS.colors["main_car"]
+    if backup is not None and SETTINGS.checkpoint_interval and \
+            increment % SETTINGS.checkpoint_interval == 0:
+        # Les métadonnées sont converties en JSON dès l'appel : l'historique peut continuer
+        # d'évoluer pendant l'écriture
+        metadata = {"generation": increment, "history": history or [],
+                    "rng": rng.bit_generator.state}
+        backup.save_checkpoint(networks, metadata=metadata, background=True)
+    return networks, last_networks
+
+
+def new_simulation(circuit: dict, networks: typing.List[Network]) -> Simulation:
+    """
+    Crée la simulation d'une génération selon la configuration
+
+    Parameters
+    ----------
+    circuit:
+        Le dictionnaire du circuit utilisé
+    networks:
+        Les réseaux neuronaux de la génération
+
+    Returns
+    -------
+    Simulation:
+        La simulation prête à être lancée
+    """
+    return Simulation(circuit, networks, SETTINGS.car_maniability, 2 * SETTINGS.scale_avg,
+                      TerminationPolicy.from_settings(SETTINGS))
+
+
+def AI_loop(screen: pygame.Surface, circuits: typing.List[dict],
+            rng: np.random.Generator) -> Network:
     """
     Boucle principale pour le mode automatique du programme
 
@@ -153,113 +375,135 @@ def AI_loop(screen: pygame.Surface, circuit: dict) -> Network:
     circuit, donc en trouver au moins une qui arrive à la fin du circuit sans toucher aucune
     bordure.
 
+    La simulation elle-même est gérée par :class:`simulation.Simulation` ; cette boucle ne fait
+    qu'afficher son état entre deux étapes. Seul le premier circuit est affiché : chaque
+    génération est aussi évaluée sans affichage sur les autres circuits, et les scores combinés
+    (voir :class:`simulation.ParallelEvaluator`). Avec plusieurs processus de calcul (option
+    `workers`), ces simulations se déroulent pendant l'affichage ; sinon, elles ont lieu à la fin
+    de chaque génération affichée.
+
     Parameters
     ----------
     screen:
         La fenêtre du programme
-    circuit:
-        Un dictionnaire contenant la liste des bordures représentant le circuit, ainsi que les deux
-        points définissant la ligne de départ
+    circuits:
+        Les dictionnaires des circuits utilisés, contenant chacun la liste des bordures
+        représentant le circuit ainsi que les deux points définissant la ligne de départ
+    rng:
+        Le générateur aléatoire utilisé pour créer et faire évoluer les réseaux
 
     Returns
     -------
     Network:
         Le meilleur réseau de la dernière génération complétée
     """
-    print("Astuce : Appuyez sur la touche R si une voiture tourne en rond\n")
+    print("Astuce : Appuyez sur la touche R pour passer à la génération suivante\n")
     clock = pygame.time.Clock()
     small_font = pygame.font.SysFont('Arial', ceil(18*SETTINGS.scale_avg))
     title_font = pygame.font.SysFont('Arial', ceil(30*SETTINGS.scale_avg))
     dt = 1
-    init_pos, init_angle = calc_starting_pos(
-        circuit["point1"], circuit["point2"])
-    cars = [Car(circuit["bordures"], color=SETTINGS.colors["cars"], starting_pos=init_pos,
-                abs_rotation=init_angle) for _ in range(SETTINGS.cars_number)]
-    networks = [Network(c) for c in cars]
-    networks[0].from_json(BackupManager().load()["network"])
-    networks[0].car.color = "#00FF00"
+    circuit = circuits[0]
+    networks = init_networks(circuit, rng)
     running = True
 
-    increment = 0
+    backup = BackupManager(CHECKPOINT_NAME)
+    increment, history = resume_networks(networks, backup, rng)
     last_sorted_networks = None
     on_pause = False
 
-    while running:
-        increment += 1
-        endgen = False
-        cleanup_done = False
-        start_time = time.time()
-        while not endgen:
-
-            temp = check_events()
-            if temp == 1:
-                endgen = True
-            if temp == 2:
-                return last_sorted_networks[0] if last_sorted_networks is not None else None
-            if temp == 3:
-                on_pause = not on_pause
-
-            screen.fill(SETTINGS.colors["background"])
-            draw.circuit(screen, circuit["bordures"])
-            draw.car(screen, (net.car for net in networks))
-
-            delta = dt * FPS / 1000
-            if not on_pause:
-                # Gestion du mouvement de la voiture
-                for net in networks:
-                    if not net.dead:
-                        net.update()
-                        net.car.abs_rotation += SETTINGS.car_maniability * delta * net.direction
-
-                        net.car.apply_vector(
-                            net.car.direction_vector() * net.engine * 2 * SETTINGS.scale_avg)
-                        if not net.car.detection(screen, SETTINGS.display_rays):
-                            net.dead = True
-                            net.car.death_time = time.time()
-
-                survived = sum(1 for n in networks if not n.dead)
-                if survived == 0:
+    with new_evaluator(circuits) if len(circuits) > 1 else nullcontext() as evaluator:
+        while running:
+            increment += 1
+            endgen = False
+            start_time = time.time()
+            if evaluator is not None:
+                extra_scores = evaluator.submit_extra(networks)
+            # Les valeurs de départ sont remises en place après la génération affichée, comme
+            # sans affichage (voir :class:`simulation.ParallelEvaluator`)
+            start_values = [[v.copy() for v in net.values] for net in networks]
+            simulation = new_simulation(circuit, networks)
+            while not endgen:
+
+                temp = check_events()
+                if temp == 1:
                     endgen = True
-                elif time.time()-start_time > 10 and not cleanup_done:
-                    for net in networks:
-                        if (not net.dead) and net.car.position[0] < 150:
-                            net.dead = True
-                            net.car.death_time = time.time()
-
-            draw.general_stats(screen, small_font, clock,
-                               increment, survived, start_time)
-            draw.car_specs(screen, small_font, networks[0])
-            draw.car_network(screen, small_font, networks[0])
-            if on_pause:
-                draw.pause_screen(screen, title_font)
-                elapsed = dt/1000
-                start_time += elapsed
-                for net in networks:
-                    if not net.dead:
-                        net.car.start_time += elapsed
-            pygame.display.flip()
-            dt = clock.tick(FPS)
-
-        arrival = circuit["bordures"][-1]  # ligne d'arrivée
-        # calcul des scores
-        for net in networks:
-            net.score = net.car.get_score()
-            if net.car.distance_to_segment(arrival) <= 8:
-                net.score += 300  # points bonus si la voiture a atteint la ligne d'arrivée
-        average = round(sum([net.score for net in networks])/len(networks))
-        print(f"Génération N°{increment} terminée - score moyen : {average}")
-        last_sorted_networks = copy.deepcopy(networks)
-
-        # Darwin
-        networks = darwin(networks)
-
-        # Reset des réseaux/voitures
-        for net in networks:
-            net.dead = 0
-            # net.car.position = [80, 130]
-            net.car.color = SETTINGS.colors["cars"]
-            net.car.reset()
-        networks[0].car.color = SETTINGS.colors["main_car"]
+                if temp == 2:
+                    return last_sorted_networks[0] if last_sorted_networks is not None else None
+                if temp == 3:
+                    on_pause = not on_pause
+
+                screen.fill(SETTINGS.colors["background"])
+                draw.circuit(screen, circuit["bordures"])
+                draw.car(screen, (net.car for net in networks))
+
+                if not on_pause:
+                    if SETTINGS.display_rays is not None:
+                        simulation.sense()
+                        draw.rays(screen, (net.car for net in simulation.alive),
+                                  SETTINGS.display_rays)
+                    simulation.step()
+                    if simulation.finished:
+                        endgen = True
+                survived = len(simulation.alive)
+
+                draw.general_stats(screen, small_font, clock,
+                                   increment, survived, start_time)
+                draw.car_specs(screen, small_font, networks[0])
+                draw.car_network(screen, small_font, networks[0])
+                if on_pause:
+                    draw.pause_screen(screen, title_font)
+                    elapsed = dt/1000
+                    start_time += elapsed
+                pygame.display.flip()
+                dt = clock.tick(FPS)
+
+            simulation.compute_scores()
+            for net, values in zip(networks, start_values):
+                net.values = values
+            if evaluator is not None:
+                evaluator.combine(networks, extra_scores())
+            networks, last_sorted_networks = end_generation(networks, increment, rng, backup,
+                                                            history)
+
+
+def headless_loop(circuits: typing.List[dict], rng: np.random.Generator) -> Network:
+    """
+    Boucle principale pour le mode automatique sans affichage
+
+    Les générations s'enchaînent aussi vite que possible, sans fenêtre ni limite de FPS, jusqu'à
+    ce que l'utilisateur arrête le programme avec Ctrl+C. Chaque génération est évaluée sur tous
+    les circuits, et répartie entre plusieurs processus selon l'option `workers` de la
+    configuration.
+
+    Parameters
+    ----------
+    circuits:
+        Les dictionnaires des circuits utilisés, contenant chacun la liste des bordures
+        représentant le circuit ainsi que les deux points définissant la ligne de départ
+    rng:
+        Le générateur aléatoire utilisé pour créer et faire évoluer les réseaux
+
+    Returns
+    -------
+    Network:
+        Le meilleur réseau de la dernière génération complétée
+    """
+    print("Entraînement sans affichage - appuyez sur Ctrl+C pour arrêter\n")
+    circuit = circuits[0]
+    networks = init_networks(circuit, rng)
+    backup = BackupManager(CHECKPOINT_NAME)
+    increment, history = resume_networks(networks, backup, rng)
+    last_sorted_networks = None
+    with new_evaluator(circuits) as evaluator:
+        try:
+            while True:
+                increment += 1
+                evaluator.evaluate(networks)
+                networks, last_sorted_networks = end_generation(networks, increment, rng,
+                                                                backup, history)
+        except KeyboardInterrupt:
+            pass
+    return last_sorted_networks[0] if last_sorted_networks is not None else None
 
 
 def main():
@@ -287,21 +531,31 @@ def main():
         pr = cProfile.Profile()
         pr.enable()
 
-    draw.init()
-    pygame.init()
-    screen = pygame.display.set_mode(SETTINGS.screen_size)
-
-    pygame.display.set_caption("TIPE")
-    circuit = circuit_creation(SETTINGS)
-
-    if SETTINGS.manual_control:
-        manual_loop(screen, circuit)
+    if SETTINGS.circuit_cache is None:
+        circuit = circuit_creation(SETTINGS)
     else:
-        last_network = AI_loop(screen, circuit)
-        if SETTINGS.autosave:
-            BackupManager().create(network=last_network)
+        circuit = CircuitCache(SETTINGS.circuit_cache).get(SETTINGS)
+    circuits = [circuit] if SETTINGS.manual_control else create_circuits(circuit)
+    # Générateur de l'évolution, indépendant de celui du circuit
+    rng = random_generators(SETTINGS.seed)[1]
 
-    pygame.quit()
+    if SETTINGS.headless and not SETTINGS.manual_control:
+        last_network = headless_loop(circuits, rng)
+    else:
+        draw.init()
+        pygame.init()
+        screen = pygame.display.set_mode(SETTINGS.screen_size)
+        pygame.display.set_caption("TIPE")
+
+        if SETTINGS.manual_control:
+            manual_loop(screen, circuit)
+        else:
+            last_network = AI_loop(screen, circuits, rng)
+        pygame.quit()
+
+    if not SETTINGS.manual_control and SETTINGS.autosave and last_network is not None:
+        BackupManager().create(network=last_network)
+        BackupManager().save_checkpoint([last_network])
 
     if SETTINGS.debug_mode:
         pr.disable()